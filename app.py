@@ -18,14 +18,6 @@ from zoneinfo import ZoneInfo
 import streamlit as st
 
 from modules.auth.password import require_password
-from modules.core.state import init_state, reset_sale_form
-from modules.data.helpers import get_conn, load_config, load_inventario
-from modules.ui.dashboard_page import render_dashboard_page
-from modules.ui.finanzas_page import render_finanzas_page
-from modules.ui.inventario_page import render_inventario_page
-from modules.ui.navigation import init_navigation_state, render_bottom_nav
-from modules.ui.styles import inject_css, money
-from modules.ui.ventas_page import render_ventas_page
 
 
 # -----------------------------
@@ -36,6 +28,18 @@ st.set_page_config(page_title="SCHELETRO Manager", page_icon="🦴", layout="cen
 # 🔒 Bloqueo antes de cargar datos
 require_password()
 
+# Imports pesados (pandas, gspread, páginas) recién después del login: la pantalla de contraseña
+# no los necesita y así aparece antes en un arranque en frío.
+from modules.core.state import init_state, reset_sale_form  # noqa: E402
+from modules.core.constants import SHEET_EGRESOS, SHEET_INVENTARIO, SHEET_VENTAS_CAB, SHEET_VENTAS_DET  # noqa: E402
+from modules.data.helpers import get_conn, load_config, load_inventario, prefetch_sheets  # noqa: E402
+from modules.ui.dashboard_page import render_dashboard_page  # noqa: E402
+from modules.ui.finanzas_page import render_finanzas_page  # noqa: E402
+from modules.ui.inventario_page import render_inventario_page  # noqa: E402
+from modules.ui.navigation import init_navigation_state, render_bottom_nav  # noqa: E402
+from modules.ui.styles import inject_css, money  # noqa: E402
+from modules.ui.ventas_page import render_ventas_page  # noqa: E402
+
 
 inject_css()
 init_state()
@@ -75,11 +79,19 @@ def fmt_bodega(x: str) -> str:
     return BODEGA_NAME.get(x, x)
 
 
-inv_df_full = load_inventario(conn, ttl_s=45)
-
 init_navigation_state()
 page = st.session_state.scheletro_page
 
+# Hojas (cache de 45–60s) que lee cada página además del Inventario: se traen juntas en un solo
+# batchGet cuando su cache venció, en vez de una lectura por hoja.
+_PAGE_SHEETS = {
+    "Dashboard": (SHEET_VENTAS_CAB, SHEET_VENTAS_DET, SHEET_EGRESOS),
+    "Finanzas": (SHEET_VENTAS_CAB, SHEET_VENTAS_DET),
+}
+prefetch_sheets(conn, (SHEET_INVENTARIO, *_PAGE_SHEETS.get(page, ())))
+
+inv_df_full = load_inventario(conn, ttl_s=45)
+
 
 if page == "Dashboard":
     render_dashboard_page(conn, inv_df_full, APP_TZ)  # FIX: pasar argumentos requeridos
@@ -1,3 +1,5 @@
+from functools import lru_cache
+import hashlib
 import hmac
 
 import streamlit as st
@@ -6,6 +8,21 @@ import streamlit as st
 # =========================
 # Seguridad: Password Gate
 # =========================
+@lru_cache(maxsize=4)
+def _secret_digest(secret: str) -> bytes:
+    """SHA-256 del secreto, calculado una vez por valor (se recalcula solo si el secreto rota)."""
+    return hashlib.sha256(secret.encode("utf-8")).digest()
+
+
+def _same_secret(given: str, expected_digest: bytes) -> bool:
+    """Comparación en tiempo constante sobre bytes UTF-8 del mismo largo.
+
+    compare_digest con str solo acepta ASCII (una clave con "ñ" lanzaría TypeError) y con largos
+    distintos corta antes; comparando los SHA-256 de ambos lados los buffers siempre miden 32 bytes.
+    """
+    return hmac.compare_digest(hashlib.sha256(given.encode("utf-8")).digest(), expected_digest)
+
+
 def require_password() -> None:
     """Bloquea la app con una contraseña guardada en Streamlit Secrets.
 
@@ -17,8 +34,10 @@ def require_password() -> None:
         st.error("No está configurado APP_PASSWORD en Secrets. Ve a Settings → Secrets y agrégalo.")
         st.stop()
 
-    # Invalida sesión si cambia la contraseña (evita sesiones viejas)
-    pw_fp = f"len:{len(str(app_pw))}"
+    # Invalida sesión si cambia la contraseña (evita sesiones viejas). La huella es el digest
+    # (cacheado), no el largo: detecta cualquier rotación y no deja el largo en session_state.
+    pw_digest = _secret_digest(str(app_pw))
+    pw_fp = pw_digest.hex()
     if st.session_state.get("_pw_fp") != pw_fp:
         st.session_state["_pw_fp"] = pw_fp
         st.session_state["_auth_ok"] = False
@@ -35,7 +54,7 @@ def require_password() -> None:
     # Callbacks: se ejecutan antes de instanciar widgets (evita StreamlitAPIException)
     def _login_action():
         pw_in = str(st.session_state.get("_auth_pw", ""))
-        if hmac.compare_digest(pw_in, str(app_pw)):
+        if _same_secret(pw_in, pw_digest):
             st.session_state["_auth_ok"] = True
             st.session_state.pop("_auth_error", None)
         else:
@@ -10,6 +10,13 @@ SHEET_CATEGORIAS = "Categorias"
 SHEET_CATALOGOS = "Catalogos"
 SHEET_EGRESOS = "Egresos"
 
+# -----------------------------
+# Opciones fijas de la UI (tuplas: no se re-crean en cada rerun)
+# -----------------------------
+METODOS_PAGO = ("Transferencia", "Efectivo", "Tarjeta", "Contra Entrega")
+BODEGAS = ("Casa", "Bodega")  # claves internas; el nombre visible sale de fmt_bodega
+TALLAS_BASE = ("XS", "S", "M", "L", "XL", "XXL", "XXXL", "OS")
+
 # -----------------------------
 # Columnas esperadas (sin destruir columnas extra)
 # -----------------------------
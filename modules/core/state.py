@@ -20,6 +20,8 @@ def init_state() -> None:
     st.session_state.setdefault("pce_otro", 2.99)
 
     st.session_state.setdefault("_reset_sale_pending", False)
+    st.session_state.setdefault("venta_seq", {})  # {año: último correlativo emitido en la sesión}
+    st.session_state.setdefault("_last_sale", (None, 0.0))  # (clave de la última venta enviada, time.monotonic())
 
     st.session_state.setdefault("ventas_modo", "ventas")
     st.session_state.setdefault("eg_monto", 0.0)
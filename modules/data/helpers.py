@@ -1,13 +1,18 @@
 from __future__ import annotations
 
 from datetime import datetime
+from functools import lru_cache
 from zoneinfo import ZoneInfo
 from typing import Any, Iterable
+import io
 import re
+import time
 import unicodedata
 
 import pandas as pd
 import streamlit as st
+from gspread import Worksheet
+from gspread.utils import rowcol_to_a1
 from streamlit_gsheets import GSheetsConnection
 
 from modules.core.constants import (
@@ -25,33 +30,40 @@ from modules.core.constants import (
     SHEET_INVERSIONES,
     SHEET_VENTAS_CAB,
     SHEET_VENTAS_DET,
+    TALLAS_BASE,
 )
 
 
 # -----------------------------
 # Data helpers (robustos)
 # -----------------------------
+@st.cache_resource(show_spinner=False)
 def get_conn() -> GSheetsConnection:
     return st.connection("gsheets", type=GSheetsConnection)
 
 
+# Regex compiladas una vez al importar (se usan por columna/fila en cada carga)
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]")
+_WS_RE = re.compile(r"\s+")
+_SLUG_DROP_RE = re.compile(r"[^A-Z0-9\s\-]")
+_VENTA_ID_RE = re.compile(r"^V-(\d{4})-(\d{4})$")
+_SKU_PROD_CODE_RE = re.compile(r"^[^-]*-([^-]*)")
+
+
 def _norm_key(s: str) -> str:
     s = str(s or "").strip().lower()
     s = s.replace("\u00A0", " ")  # nbsp
-    return re.sub(r"[^a-z0-9]", "", s)
+    return _NON_ALNUM_RE.sub("", s)
 
 
-def _normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-    df.columns = [str(c).replace("\u00A0", " ").strip() for c in df.columns]
-    return df
-
-
-def _align_required_columns(df: pd.DataFrame, required: list[str]) -> pd.DataFrame:
-    df = _normalize_columns(df)
-
-    existing = df.columns.tolist()
-    existing_map = {_norm_key(c): c for c in existing}
+@lru_cache(maxsize=64)
+def _column_plan(columns: tuple[Any, ...], required: tuple[str, ...]) -> tuple[tuple[str, ...], tuple[str, ...]]:
+    """
+    (nombres finales, requeridas faltantes) para un encabezado dado. El encabezado de cada hoja
+    casi nunca cambia entre lecturas, así que el mapeo se calcula una vez por combinación.
+    """
+    normalized = [str(c).replace("\u00A0", " ").strip() for c in columns]
+    existing_map = {_norm_key(c): c for c in normalized}
 
     rename_map: dict[str, str] = {}
     for req in required:
@@ -59,11 +71,18 @@ def _align_required_columns(df: pd.DataFrame, required: list[str]) -> pd.DataFra
         if k in existing_map:
             rename_map[existing_map[k]] = req
 
-    df = df.rename(columns=rename_map)
+    final = tuple(rename_map.get(c, c) for c in normalized)
+    missing = tuple(req for req in required if req not in final)
+    return final, missing
 
-    for req in required:
-        if req not in df.columns:
-            df[req] = ""
+
+def _align_required_columns(df: pd.DataFrame, required: list[str]) -> pd.DataFrame:
+    final, missing = _column_plan(tuple(df.columns), tuple(required))
+    df = df.set_axis(list(final), axis=1)
+
+    # Columnas faltantes en una sola pasada (reindex) en lugar de insertarlas una por una
+    if missing:
+        df = df.reindex(columns=[*final, *missing], fill_value="")
 
     return df
 
@@ -94,21 +113,68 @@ def _clean_number(x: Any) -> float:
         return 0.0
 
 
+def _numeric_series(s: pd.Series) -> pd.Series:
+    """Versión vectorizada de _clean_number para una columna completa."""
+    if pd.api.types.is_bool_dtype(s):
+        return s.astype(float)
+    txt = (
+        s.astype(str)
+        .str.strip()
+        .str.replace("$", "", regex=False)
+        .str.replace(",", "", regex=False)
+        .str.strip()
+    )
+    pct = txt.str.endswith("%", na=False)
+    txt = txt.where(~pct, txt.str[:-1].str.strip())
+    num = pd.to_numeric(txt, errors="coerce")
+    return num.where(~pct, num / 100.0).fillna(0.0).astype(float)
+
+
 def _to_numeric(df: pd.DataFrame, cols: Iterable[str]) -> pd.DataFrame:
-    df = df.copy()
-    for c in cols:
-        if c in df.columns:
-            df[c] = df[c].apply(_clean_number)
+    # Los loaders siempre pasan un DataFrame propio (viene de _align_required_columns): no hace falta copiar
+    present = [c for c in cols if c in df.columns]
+    bool_cols = [c for c in present if pd.api.types.is_bool_dtype(df[c])]
+    # Columnas que ya llegan numéricas (no hay "$", "," ni "%" que limpiar): solo NaN -> 0 y float
+    num_cols = [c for c in present if c not in bool_cols and pd.api.types.is_numeric_dtype(df[c])]
+    text_cols = [c for c in present if c not in bool_cols and c not in num_cols]
+    if num_cols:
+        df[num_cols] = df[num_cols].astype(float).fillna(0.0)
+    if text_cols:
+        # Todas las columnas apiladas en una sola Serie: una pasada de .str/to_numeric en vez de una por columna
+        block = df[text_cols].to_numpy(dtype=object)
+        flat = _numeric_series(pd.Series(block.ravel()))
+        df[text_cols] = flat.to_numpy().reshape(block.shape)
+    if bool_cols:
+        df[bool_cols] = df[bool_cols].astype(float)
     return df
 
 
-def _to_bool(v: Any) -> bool:
-    if isinstance(v, bool):
-        return v
-    if isinstance(v, (int, float)) and not pd.isna(v):
-        return float(v) != 0.0
-    s = str(v).strip().lower()
-    return s in ["true", "t", "1", "yes", "y", "si", "sí", "verdadero", "activo"]
+def _to_str(df: pd.DataFrame, cols: Iterable[str]) -> pd.DataFrame:
+    present = [c for c in cols if c in df.columns]
+    if present:
+        df[present] = df[present].astype(str).fillna("").apply(lambda s: s.str.strip())
+    return df
+
+
+_TRUTHY = frozenset(["true", "t", "1", "yes", "y", "si", "sí", "verdadero", "activo"])
+
+
+def _bool_series(s: pd.Series) -> pd.Series:
+    """
+    Versión vectorizada del parseo de flags (Activo): bool tal cual, números != 0,
+    textos en _TRUTHY (sin importar mayúsculas/espacios). NaN/vacío -> False.
+    """
+    if pd.api.types.is_bool_dtype(s):
+        return s.astype(bool)
+    if pd.api.types.is_numeric_dtype(s):
+        return s.notna() & s.ne(0)
+    out = s.astype(str).str.strip().str.lower().isin(_TRUTHY)
+    # Números sueltos dentro de una columna de texto (ej. 2 o 1.0) cuentan como != 0
+    not_text = ~s.map(type).eq(str)
+    if not_text.any():
+        num = pd.to_numeric(s.where(not_text), errors="coerce")
+        out |= num.notna() & num.ne(0)
+    return out
 
 
 def _is_rate_limit(e: Exception) -> bool:
@@ -129,51 +195,139 @@ def _raise_rate_limit_error(action: str, worksheet: str, original_error: Excepti
     ) from original_error
 
 
+class DuplicateKeyError(ValueError):
+    """La clave que se iba a dar de alta ya existe en la hoja (no se escribió nada)."""
+
+
 def _normalize_df(df: pd.DataFrame) -> pd.DataFrame:
     """Limpia nombres de columnas y garantiza DataFrame."""
     if df is None or not isinstance(df, pd.DataFrame):
         return pd.DataFrame()
-    out = df.copy()
-    out.columns = [str(c).strip() for c in out.columns]
-    return out
+    # Siempre llega un DataFrame recién leído (conn.read/export/batchGet): basta con renombrar
+    return df.set_axis([str(c).strip() for c in df.columns], axis=1)
 
 
-@st.cache_data(ttl=45, show_spinner=False)
-def _cached_read_45(worksheet: str) -> pd.DataFrame:
+# Versión por hoja a nivel proceso (st.cache_data también es de proceso, compartido entre sesiones).
+# Cada escritura incrementa la versión de las hojas tocadas: sus lecturas cacheadas fallan y se
+# releen, y el resto (Config, Catálogos, ...) sigue sirviéndose del cache.
+_SHEET_VERSION: dict[str, int] = {}
+
+
+def sheet_version(worksheet: str) -> int:
+    return _SHEET_VERSION.get(worksheet, 0)
+
+
+def bump_sheet_version(*worksheets: str) -> None:
+    for ws in worksheets:
+        _SHEET_VERSION[ws] = _SHEET_VERSION.get(ws, 0) + 1
+
+
+# Hojas de solo lectura frecuente que pueden leerse por export CSV (opt-in con GSHEETS_CSV_EXPORT)
+_CSV_EXPORT_SHEETS = {SHEET_INVENTARIO, SHEET_VENTAS_CAB, SHEET_VENTAS_DET}
+
+
+def _csv_export_enabled() -> bool:
     try:
-        _conn = st.connection("gsheets", type=GSheetsConnection)
-        df = _conn.read(worksheet=worksheet, ttl=45)
-        return _normalize_df(df)
-    except Exception as e:
-        # Para lecturas cacheadas no reventamos toda la UI.
-        if _is_rate_limit(e):
-            st.warning("Google Sheets está rate-limited (429). Usando cache/local vacío temporalmente.")
-        else:
-            st.warning(f"No se pudo leer '{worksheet}': {e}")
+        return bool(st.secrets.get("GSHEETS_CSV_EXPORT", False))
+    except Exception:
+        return False
+
+
+def _read_csv_export(conn: GSheetsConnection, worksheet: str) -> pd.DataFrame:
+    """
+    Lee una hoja con un solo GET a /export?format=csv&gid=... usando la sesión
+    autenticada del service account (no cuenta contra la cuota de la Sheets API).
+    """
+    ss, sheet_ids = _spreadsheet_handle(conn)
+    url = f"https://docs.google.com/spreadsheets/d/{ss.id}/export?format=csv&gid={sheet_ids[worksheet]}"
+    resp = ss.client.session.get(url, timeout=30)
+    resp.raise_for_status()
+    return _normalize_df(pd.read_csv(io.BytesIO(resp.content), dtype=str, keep_default_na=False))
+
+
+# Lecturas agrupadas: {hoja: (versión, time.time() de la lectura, DataFrame)}. prefetch_sheets trae
+# varias hojas en un solo values.batchGet y cada _cached_read que falle su cache toma de acá en vez de
+# leer aparte, solo si la copia es de su misma ventana (slot) de tiempo.
+_PREFETCHED: dict[str, tuple[int, float, pd.DataFrame]] = {}
+_PREFETCH_BUCKET_S = 45
+
+
+def clear_prefetch() -> None:
+    """Descarta las copias agrupadas (ej. botón Refrescar, junto con st.cache_data.clear())."""
+    _PREFETCHED.clear()
+
+
+def _values_to_df(values: list[list[Any]]) -> pd.DataFrame:
+    """Filas crudas de la API (fila 1 = encabezado) -> DataFrame de texto, sin filas en blanco."""
+    if not values:
         return pd.DataFrame()
+    header = [str(h) for h in values[0]]
+    n = len(header)
+    body = [
+        (list(r) + [""] * (n - len(r)))[:n]
+        for r in values[1:]
+        if any(str(v).strip() for v in r)
+    ]
+    return _normalize_df(pd.DataFrame(body, columns=header, dtype=str))
 
 
-@st.cache_data(ttl=180, show_spinner=False)
-def _cached_read_180(worksheet: str) -> pd.DataFrame:
+def prefetch_sheets(conn: GSheetsConnection, worksheets: Iterable[str]) -> None:
+    """
+    Trae en UN solo values.batchGet las hojas (del bucket de 45s) cuya copia agrupada no existe,
+    es de otra versión o de una ventana de 45s anterior. Si la lectura falla no pasa nada: cada
+    loader lee su hoja por separado como siempre.
+    """
+    now = time.time()
+    slot = int(now // _PREFETCH_BUCKET_S)
+    todo = []
+    for ws in dict.fromkeys(worksheets):
+        hit = _PREFETCHED.get(ws)
+        if hit is None or hit[0] != sheet_version(ws) or int(hit[1] // _PREFETCH_BUCKET_S) != slot:
+            todo.append(ws)
+    if not todo:
+        return
+    versions = [sheet_version(ws) for ws in todo]
     try:
-        _conn = st.connection("gsheets", type=GSheetsConnection)
-        df = _conn.read(worksheet=worksheet, ttl=180)
-        return _normalize_df(df)
-    except Exception as e:
-        if _is_rate_limit(e):
-            st.warning("Google Sheets está rate-limited (429). Usando cache/local vacío temporalmente.")
-        else:
-            st.warning(f"No se pudo leer '{worksheet}': {e}")
-        return pd.DataFrame()
+        ss, _ = _spreadsheet_handle(conn)
+        resp = ss.values_batch_get([f"'{ws}'" for ws in todo])
+    except Exception:
+        return
+    for ws, version, vr in zip(todo, versions, resp.get("valueRanges", [])):
+        _PREFETCHED[ws] = (version, now, _values_to_df(vr.get("values") or []))
 
 
-@st.cache_data(ttl=600, show_spinner=False)
-def _cached_read_600(worksheet: str) -> pd.DataFrame:
+def _take_prefetched(worksheet: str, version: int, bucket: int, slot: int) -> pd.DataFrame | None:
+    """Copia agrupada solo si es de esta versión y se leyó dentro del mismo slot del lector."""
+    hit = _PREFETCHED.get(worksheet)
+    if hit is None or hit[0] != version or int(hit[1] // bucket) != slot:
+        return None
+    return hit[2]
+
+
+# Vigencia (s) de cada nivel de cache de lectura; load_raw_sheet elige el nivel según ttl_s
+_TTL_BUCKETS = (45, 180, 600)
+
+
+@st.cache_data(ttl=max(_TTL_BUCKETS), show_spinner=False)
+def _cached_read(worksheet: str, version: int, bucket: int, slot: int) -> pd.DataFrame:
+    """
+    Único lector cacheado. `slot` = ventana de tiempo del bucket (time.time() // bucket): al
+    cambiar de ventana cambia la clave y se relee; las entradas viejas las expulsa el ttl general.
+    """
     try:
-        _conn = st.connection("gsheets", type=GSheetsConnection)
-        df = _conn.read(worksheet=worksheet, ttl=600)
+        prefetched = _take_prefetched(worksheet, version, bucket, slot)
+        if prefetched is not None:
+            return prefetched
+        _conn = get_conn()  # singleton de proceso (cache_resource)
+        if worksheet in _CSV_EXPORT_SHEETS and _csv_export_enabled():
+            try:
+                return _read_csv_export(_conn, worksheet)
+            except Exception:
+                pass  # si el export falla, se lee por la API como siempre
+        df = _conn.read(worksheet=worksheet, ttl=1)  # el cache real es este (versionado)
         return _normalize_df(df)
     except Exception as e:
+        # Para lecturas cacheadas no reventamos toda la UI.
         if _is_rate_limit(e):
             st.warning("Google Sheets está rate-limited (429). Usando cache/local vacío temporalmente.")
         else:
@@ -188,7 +342,7 @@ def load_raw_sheet(conn: GSheetsConnection, worksheet: str, ttl_s: int = 45) ->
     - ttl_s <= 0 fuerza lectura directa (sin cache_data) para operaciones críticas.
     - En lecturas críticas, si hay 429, SE LANZA EXCEPCIÓN.
     """
-    ttl_s = int(ttl_s or 45)
+    ttl_s = 45 if ttl_s is None else int(ttl_s)
 
     # Lectura crítica/directa: NO debe fallar silenciosamente
     if ttl_s <= 0:
@@ -204,12 +358,9 @@ def load_raw_sheet(conn: GSheetsConnection, worksheet: str, ttl_s: int = 45) ->
                 _raise_rate_limit_error("leer", worksheet, e)
             raise
 
-    # Lectura cacheada/no crítica
-    if ttl_s <= 60:
-        return _cached_read_45(worksheet).copy()
-    if ttl_s <= 300:
-        return _cached_read_180(worksheet).copy()
-    return _cached_read_600(worksheet).copy()
+    # Lectura cacheada/no crítica (st.cache_data ya entrega una copia propia en cada llamada)
+    bucket = _TTL_BUCKETS[0] if ttl_s <= 60 else _TTL_BUCKETS[1] if ttl_s <= 300 else _TTL_BUCKETS[2]
+    return _cached_read(worksheet, sheet_version(worksheet), bucket, int(time.time() // bucket))
 
 
 def save_sheet(conn: GSheetsConnection, worksheet: str, df: pd.DataFrame) -> None:
@@ -232,11 +383,333 @@ def save_sheet(conn: GSheetsConnection, worksheet: str, df: pd.DataFrame) -> Non
             _raise_rate_limit_error("escribir", worksheet, e)
         raise
 
-    # Limpiar cache para que las lecturas posteriores vean el cambio real.
+    # Invalidar solo esta hoja para que las lecturas posteriores vean el cambio real.
+    bump_sheet_version(worksheet)
+
+
+def _worksheet(conn: GSheetsConnection, worksheet: str) -> Worksheet:
+    """Worksheet de gspread detrás de la conexión (solo cuenta de servicio)."""
+    return conn.client._select_worksheet(worksheet=worksheet)
+
+
+def _cell_value(v: Any) -> Any:
+    if v is None:
+        return ""
+    if isinstance(v, float) and pd.isna(v):
+        return ""
+    if hasattr(v, "item"):  # escalares numpy -> tipos nativos (JSON)
+        return v.item()
+    return v
+
+
+def append_rows_sheet(
+    conn: GSheetsConnection,
+    worksheet: str,
+    rows: list[dict[str, Any]],
+    required: list[str],
+) -> None:
+    """
+    Agrega filas al final de la hoja SIN reescribirla (append-only).
+    Sube solo las filas nuevas en vez de toda la tabla.
+
+    - Respeta el orden real de columnas del encabezado (fila 1).
+    - Si faltan columnas requeridas en el encabezado, las agrega al final.
+    - Si falla por 429, LANZA EXCEPCIÓN (igual que save_sheet).
+    - Si la conexión no expone el worksheet de gspread, cae al append clásico
+      (leer + concat + save_sheet).
+    """
+    if not rows:
+        return
     try:
-        st.cache_data.clear()
-    except Exception:
-        pass
+        ws = _worksheet(conn, worksheet)
+    except AttributeError:
+        df = _align_required_columns(load_raw_sheet(conn, worksheet, ttl_s=0), required)
+        save_sheet(conn, worksheet, pd.concat([df, pd.DataFrame(rows)], ignore_index=True))
+        return
+    try:
+        header = [str(h).replace("\u00A0", " ").strip() for h in ws.row_values(1)]
+        header_keys = [_norm_key(h) for h in header]
+
+        missing = [c for c in required if _norm_key(c) not in header_keys]
+        if missing:
+            start = rowcol_to_a1(1, len(header) + 1)
+            ws.update(start, [missing], value_input_option="USER_ENTERED")
+            header += missing
+            header_keys += [_norm_key(c) for c in missing]
+
+        key_to_req = {_norm_key(c): c for c in required}
+        values = [
+            [_cell_value(row.get(key_to_req[k], "")) if k in key_to_req else "" for k in header_keys]
+            for row in rows
+        ]
+        ws.append_rows(values, value_input_option="USER_ENTERED", table_range="A1")
+    except Exception as e:
+        if _is_rate_limit(e):
+            st.error(
+                "⚠️ Google Sheets te limitó por demasiadas solicitudes (error 429) al ESCRIBIR. "
+                "Esperá 60–90 segundos y reintentá."
+            )
+            _raise_rate_limit_error("escribir", worksheet, e)
+        raise
+
+    bump_sheet_version(worksheet)
+
+
+def _sheet_cell(v: Any) -> dict[str, Any]:
+    v = _cell_value(v)
+    if isinstance(v, bool):
+        return {"userEnteredValue": {"boolValue": v}}
+    if isinstance(v, (int, float)):
+        return {"userEnteredValue": {"numberValue": v}}
+    return {"userEnteredValue": {"stringValue": str(v)}}
+
+
+def _header_keys(values_range: dict[str, Any]) -> list[str]:
+    rows = values_range.get("values") or [[]]
+    return [_norm_key(str(h).replace("\u00A0", " ")) for h in rows[0]]
+
+
+# Últimos encabezados vistos por hoja (proceso). Permiten leer encabezados + columnas clave en UNA
+# sola batchGet; si el encabezado real no coincide se vuelve a leer con el correcto.
+_HEADER_KEYS: dict[str, list[str]] = {}
+
+
+@st.cache_resource(show_spinner=False)
+def _spreadsheet_handle(_conn: GSheetsConnection) -> tuple[Any, dict[str, int]]:
+    """
+    Spreadsheet (gspread) + {titulo: sheetId}. Abrir el archivo y listar sus hojas son dos
+    lecturas de metadata; los IDs no cambian, así que se resuelven una vez por proceso.
+    """
+    ss = _conn.client._open_spreadsheet()
+    return ss, {ws.title: ws.id for ws in ss.worksheets()}
+
+
+def batch_write_sheets(
+    conn: GSheetsConnection,
+    appends: list[tuple[str, list[dict[str, Any] | list[Any]], list[str]]],
+    cell_updates: list[tuple[str, str, str, str, Any]],
+    cell_deltas: list[tuple[str, str, str, str, float]] | None = None,
+    absent_keys: list[tuple[str, str, Any]] | None = None,
+) -> None:
+    """
+    Escribe varias hojas en UN solo spreadsheets.batchUpdate (atómico):
+    - appends: (hoja, filas, columnas requeridas) -> appendCells al final.
+      Cada fila puede ser un dict o una lista con los valores en el orden de `required`.
+    - cell_updates: (hoja, col_clave, valor_clave, columna, nuevo_valor)
+      -> updateCells sobre la celda exacta (ej: stock de un SKU).
+    - cell_deltas: (hoja, col_clave, valor_clave, columna, delta)
+      -> suma `delta` al valor ACTUAL de la celda (leído en este mismo paso).
+      Si alguna quedaría negativa, lanza ValueError y no escribe nada.
+    - absent_keys: (hoja, col_clave, valor_clave) que NO deben existir todavía (ej: el Venta_ID
+      nuevo). Si alguno ya está en la hoja, lanza DuplicateKeyError y no escribe nada.
+
+    Lee antes solo los encabezados, las columnas clave y las columnas con delta (rangos chicos),
+    en una sola batchGet cuando los encabezados ya se conocen (si cambiaron, se relee una vez).
+    Si falla por 429, LANZA EXCEPCIÓN (igual que save_sheet).
+    """
+    cell_deltas = cell_deltas or []
+    absent_keys = absent_keys or []
+    sheets = list(dict.fromkeys(
+        [a[0] for a in appends] + [u[0] for u in cell_updates] + [d[0] for d in cell_deltas]
+        + [k[0] for k in absent_keys]
+    ))
+    if not sheets:
+        return
+    try:
+        ss, sheet_ids = _spreadsheet_handle(conn)
+        if any(name not in sheet_ids for name in sheets):
+            # Hoja creada/renombrada después de cachear -> refrescar IDs
+            _spreadsheet_handle.clear()
+            ss, sheet_ids = _spreadsheet_handle(conn)
+
+        head_ranges = [f"'{name}'!1:1" for name in sheets]
+        unformatted = {"valueRenderOption": "UNFORMATTED_VALUE"}
+        targets = [u[:2] for u in cell_updates] + [d[:2] for d in cell_deltas]
+        key_ranges: list[tuple[str, str]] = list(dict.fromkeys(targets + [k[:2] for k in absent_keys]))
+        delta_cols: list[tuple[str, str]] = list(dict.fromkeys((d[0], d[3]) for d in cell_deltas))
+
+        def _col_ranges(hdrs: dict[str, list[str]]) -> list[str]:
+            # Columnas clave + columnas con delta (posiciones según `hdrs`)
+            out = []
+            for name, col_name in key_ranges + delta_cols:
+                letter = rowcol_to_a1(1, hdrs[name].index(_norm_key(col_name)) + 1)[:-1]
+                out.append(f"'{name}'!{letter}:{letter}")
+            return out
+
+        # Camino optimista: con los encabezados ya conocidos, encabezados + columnas en una lectura.
+        headers: dict[str, list[str]] | None = None
+        value_ranges: list[dict[str, Any]] | None = None
+        if all(name in _HEADER_KEYS for name in sheets):
+            guess = {name: list(_HEADER_KEYS[name]) for name in sheets}
+            try:
+                guess_ranges = _col_ranges(guess)
+            except ValueError:
+                guess_ranges = None
+            if guess_ranges is not None:
+                resp = ss.values_batch_get(head_ranges + guess_ranges, params=unformatted)
+                vrs = resp.get("valueRanges", [])
+                headers = {name: _header_keys(vr) for name, vr in zip(sheets, vrs)}
+                if headers == guess:
+                    value_ranges = vrs[len(sheets):]
+        if headers is None:
+            resp = ss.values_batch_get(head_ranges)
+            headers = {name: _header_keys(vr) for name, vr in zip(sheets, resp.get("valueRanges", []))}
+        _HEADER_KEYS.update({name: list(keys) for name, keys in headers.items()})
+        if value_ranges is None:
+            # Una columna de absent_keys que aún no existe no puede tener el valor: no se lee
+            absent_only = {k[:2] for k in absent_keys} - set(targets)
+            key_ranges = [
+                kr for kr in key_ranges
+                if kr not in absent_only or _norm_key(kr[1]) in headers.get(kr[0], [])
+            ]
+
+        requests: list[dict[str, Any]] = []
+
+        # Columnas requeridas que no existen aún en el encabezado -> se agregan al final.
+        for name, _, required in appends:
+            keys = headers.setdefault(name, [])
+            missing = [c for c in required if _norm_key(c) not in keys]
+            if missing:
+                requests.append({
+                    "updateCells": {
+                        "start": {"sheetId": sheet_ids[name], "rowIndex": 0, "columnIndex": len(keys)},
+                        "rows": [{"values": [_sheet_cell(c) for c in missing]}],
+                        "fields": "userEnteredValue",
+                    }
+                })
+                keys += [_norm_key(c) for c in missing]
+
+        key_rows: dict[tuple[str, str], dict[str, int]] = {}
+        col_values: dict[tuple[str, str], list[list[Any]]] = {}
+        if key_ranges:
+            if value_ranges is None:
+                # Encabezado desconocido o cambiado: columnas con las posiciones reales
+                resp = ss.values_batch_get(_col_ranges(headers), params=unformatted)
+                value_ranges = resp.get("valueRanges", [])
+            # Solo las claves pedidas (ej. 1-2 SKUs): se corta el recorrido apenas aparecen todas,
+            # en vez de armar un mapa con todas las filas de la hoja.
+            wanted: dict[tuple[str, str], set[str]] = {}
+            for name, key_col, key, *_ in list(cell_updates) + list(cell_deltas) + list(absent_keys):
+                wanted.setdefault((name, key_col), set()).add(str(key).strip())
+            for kr, vr in zip(key_ranges, value_ranges):
+                pending = set(wanted[kr])
+                rows_map: dict[str, int] = {}
+                for i, r in enumerate(vr.get("values") or []):
+                    if i == 0 or not r:
+                        continue
+                    k = str(r[0]).strip()
+                    if k in pending:
+                        rows_map[k] = i  # gana la primera fila, igual que antes
+                        pending.discard(k)
+                        if not pending:
+                            break
+                key_rows[kr] = rows_map
+            for dc, vr in zip(delta_cols, value_ranges[len(key_ranges):]):
+                col_values[dc] = vr.get("values") or []
+
+        for name, key_col, key in absent_keys:
+            if str(key).strip() in key_rows.get((name, key_col), {}):
+                raise DuplicateKeyError(f"'{key}' ya existe en la columna {key_col} de '{name}'.")
+
+        def _row_of(name: str, key_col: str, key: Any) -> int:
+            row_ix = key_rows[(name, key_col)].get(str(key).strip())
+            if row_ix is None:
+                raise ValueError(f"No encontré '{key}' en la columna {key_col} de '{name}'.")
+            return row_ix
+
+        # Deltas sobre el valor actual (se agregan por celda antes de validar)
+        delta_sum: dict[tuple[str, str, str, str], float] = {}
+        for name, key_col, key, col, delta in cell_deltas:
+            k = (name, key_col, str(key).strip(), col)
+            delta_sum[k] = delta_sum.get(k, 0) + delta
+        resolved: list[tuple[str, str, str, str, Any]] = list(cell_updates)
+        for (name, key_col, key, col), delta in delta_sum.items():
+            row_ix = _row_of(name, key_col, key)
+            vals = col_values[(name, col)]
+            current = _clean_number(vals[row_ix][0] if row_ix < len(vals) and vals[row_ix] else 0)
+            new_value = current + delta
+            if new_value < 0:
+                raise ValueError(
+                    f"'{col}' de '{key}' no alcanza: disponible={current:g}, cambio={delta:g}."
+                )
+            resolved.append((name, key_col, key, col, int(new_value) if float(new_value).is_integer() else new_value))
+
+        for name, rows, required in appends:
+            if not rows:
+                continue
+            # posición en `required` de cada columna del encabezado (None = columna ajena)
+            req_pos = {_norm_key(c): i for i, c in enumerate(required)}
+            pos = [req_pos.get(k) for k in headers[name]]
+            blank = _sheet_cell("")
+            rows_values = [
+                [row.get(c, "") for c in required] if isinstance(row, dict) else row
+                for row in rows
+            ]
+            requests.append({
+                "appendCells": {
+                    "sheetId": sheet_ids[name],
+                    "rows": [
+                        {"values": [blank if i is None else _sheet_cell(vals[i]) for i in pos]}
+                        for vals in rows_values
+                    ],
+                    "fields": "userEnteredValue",
+                }
+            })
+
+        for name, key_col, key, col, value in resolved:
+            row_ix = _row_of(name, key_col, key)
+            requests.append({
+                "updateCells": {
+                    "start": {
+                        "sheetId": sheet_ids[name],
+                        "rowIndex": row_ix,
+                        "columnIndex": headers[name].index(_norm_key(col)),
+                    },
+                    "rows": [{"values": [_sheet_cell(value)]}],
+                    "fields": "userEnteredValue",
+                }
+            })
+
+        if requests:
+            ss.batch_update({"requests": requests})
+            _HEADER_KEYS.update({name: list(keys) for name, keys in headers.items()})
+    except Exception as e:
+        if _is_rate_limit(e):
+            st.error(
+                "⚠️ Google Sheets te limitó por demasiadas solicitudes (error 429) al ESCRIBIR. "
+                "Esperá 60–90 segundos y reintentá."
+            )
+            _raise_rate_limit_error("escribir", ", ".join(sheets), e)
+        raise
+
+    bump_sheet_version(*sheets)
+
+
+def commit_sale(
+    conn: GSheetsConnection,
+    cab_row: list[Any],
+    det_rows: list[list[Any]],
+    stock_deltas: dict[tuple[str, str], int],
+) -> None:
+    """
+    Registra una venta en un solo round-trip: cabecera + detalle (append) y
+    el descuento de stock {(SKU, columna): delta} sobre el valor actual de Inventario.
+    Si algún stock quedaría negativo lanza ValueError y no escribe nada; si el Venta_ID ya
+    está en la hoja (cabecera cacheada atrasada) lanza DuplicateKeyError y no escribe nada.
+    """
+    batch_write_sheets(
+        conn,
+        appends=[
+            (SHEET_VENTAS_CAB, [cab_row], CAB_REQUIRED),
+            (SHEET_VENTAS_DET, det_rows, DET_REQUIRED),
+        ],
+        cell_updates=[],
+        cell_deltas=[
+            (SHEET_INVENTARIO, "SKU", sku, col, delta)
+            for (sku, col), delta in stock_deltas.items()
+        ],
+        absent_keys=[(SHEET_VENTAS_CAB, "Venta_ID", cab_row[0])],
+    )
 
 
 def load_config(conn: GSheetsConnection, ttl_s: int = 120) -> dict[str, Any]:
@@ -245,39 +718,131 @@ def load_config(conn: GSheetsConnection, ttl_s: int = 120) -> dict[str, Any]:
         return {}
     df = _align_required_columns(df, ["Parametro", "Valor", "Notas"])
 
-    out: dict[str, Any] = {}
-    for _, row in df.iterrows():
-        k = str(row.get("Parametro", "")).strip()
-        if not k:
-            continue
-        out[k] = row.get("Valor", "")
-    return out
+    # {Parametro: Valor} sin iterrows; claves vacías fuera, ante duplicados gana la última fila
+    keys = df["Parametro"].astype(str).fillna("").str.strip()
+    mask = keys.ne("")
+    return dict(zip(keys[mask], df["Valor"][mask]))
 
 
-def load_inventario(conn: GSheetsConnection, ttl_s: int = 45) -> pd.DataFrame:
-    df = load_raw_sheet(conn, SHEET_INVENTARIO, ttl_s=ttl_s)
+def _prepare_inventario(df: pd.DataFrame) -> pd.DataFrame:
     if df.empty:
         return _align_required_columns(pd.DataFrame(), INV_REQUIRED)
 
     df = _align_required_columns(df, INV_REQUIRED)
     df = _to_numeric(df, ["Stock_Casa", "Stock_Bodega", "Costo_Unitario", "Precio_Lista"])
+    # Unidades enteras desde la carga: las pantallas suman/leen sin castear por celda ni por rerun
+    df[["Stock_Casa", "Stock_Bodega"]] = df[["Stock_Casa", "Stock_Bodega"]].astype("int64")
 
-    for c in ["SKU", "Drop", "Producto", "Color", "Talla"]:
-        df[c] = df[c].astype(str).fillna("").str.strip()
+    df = _to_str(df, ["SKU", "Drop", "Producto", "Color", "Talla"])
+    # Pocas categorías repetidas en muchas filas: comparar/filtrar por código es mucho más barato
+    df[["Producto", "Talla", "Drop", "Color"]] = df[["Producto", "Talla", "Drop", "Color"]].astype("category")
 
-    df["Activo"] = df["Activo"].apply(_to_bool)
+    df["Activo"] = _bool_series(df["Activo"])
     return df
 
 
-def load_egresos(conn: GSheetsConnection, ttl_s: int = 60) -> pd.DataFrame:
-    df = load_raw_sheet(conn, SHEET_EGRESOS, ttl_s=ttl_s)
+@st.cache_data(ttl=45, show_spinner=False)
+def _cached_inventario(_conn: GSheetsConnection, ttl_s: int, version: int) -> pd.DataFrame:
+    return _prepare_inventario(load_raw_sheet(_conn, SHEET_INVENTARIO, ttl_s=ttl_s))
+
+
+def load_inventario(conn: GSheetsConnection, ttl_s: int = 45) -> pd.DataFrame:
+    """
+    Inventario ya tipado. Con ttl_s > 0 se cachea el resultado final
+    (no solo la lectura cruda) para no re-limpiar en cada rerun.
+    ttl_s <= 0 lee directo de Sheets (validaciones antes de escribir).
+    """
+    if ttl_s is not None and int(ttl_s) <= 0:
+        return _prepare_inventario(load_raw_sheet(conn, SHEET_INVENTARIO, ttl_s=0))
+    return _cached_inventario(conn, int(ttl_s or 45), sheet_version(SHEET_INVENTARIO))
+
+
+def build_inventory_index(inv_df: pd.DataFrame) -> dict[str, Any]:
+    """
+    Índices de búsqueda O(1) sobre el inventario (labels del DataFrame):
+    - by_sku: {SKU: label}
+    - productos: productos no vacíos, ya ordenados
+    - rows: {Producto: [labels]} con todas las filas de cada producto
+    - totals: {Producto: (Stock_Casa, Stock_Bodega)} sumados en un solo groupby
+    - variants: {Producto: {Color: {Talla: label}}} ordenado para los selectbox.
+    - items: {label: (SKU, Drop, Precio_Lista, Stock_Casa, Stock_Bodega)} como escalares Python,
+      para leer la variante elegida sin pasar por el indexado de pandas.
+    Ante duplicados gana la primera fila (igual que .iloc[0] sobre un filtro).
+    """
+    by_sku: dict[str, Any] = {}
+    rows: dict[str, list[Any]] = {}
+    variants: dict[str, dict[str, dict[str, Any]]] = {}
+    if inv_df is None or inv_df.empty:
+        return {"by_sku": by_sku, "productos": [], "rows": rows, "variants": variants, "items": {}, "totals": {}}
+
+    for label, sku, prod, color, talla in zip(
+        inv_df.index, inv_df["SKU"], inv_df["Producto"], inv_df["Color"], inv_df["Talla"]
+    ):
+        by_sku.setdefault(str(sku).strip(), label)
+        p, c, t = str(prod).strip(), str(color).strip(), str(talla).strip()
+        if p:
+            rows.setdefault(p, []).append(label)
+        if p and c and t:
+            variants.setdefault(p, {}).setdefault(c, {}).setdefault(t, label)
+
+    variants = {
+        p: {c: {t: by_t[t] for t in sorted(by_t)} for c, by_t in sorted(by_c.items())}
+        for p, by_c in sorted(variants.items())
+    }
+    items = dict(zip(
+        inv_df.index,
+        zip(
+            inv_df["SKU"].tolist(),
+            inv_df["Drop"].tolist(),
+            inv_df["Precio_Lista"].astype(float).tolist(),
+            inv_df["Stock_Casa"].tolist(),
+            inv_df["Stock_Bodega"].tolist(),
+        ),
+    ))
+    sums = (
+        inv_df[["Stock_Casa", "Stock_Bodega"]]
+        .groupby(inv_df["Producto"].astype(str).str.strip(), sort=False)
+        .sum()
+    )
+    totals = {
+        p: (int(casa), int(bod))
+        for p, casa, bod in zip(sums.index, sums["Stock_Casa"], sums["Stock_Bodega"])
+        if p
+    }
+    return {
+        "by_sku": by_sku,
+        "productos": sorted(rows),
+        "rows": rows,
+        "variants": variants,
+        "items": items,
+        "totals": totals,
+    }
+
+
+@st.cache_data(show_spinner=False)
+def inventory_index(inv_df: pd.DataFrame) -> dict[str, Any]:
+    """build_inventory_index cacheado por contenido del DataFrame (se arma una vez por carga)."""
+    return build_inventory_index(inv_df)
+
+
+def _prepare_egresos(df: pd.DataFrame) -> pd.DataFrame:
     if df.empty:
-        return _align_required_columns(pd.DataFrame(), EG_REQUIRED)
+        return _with_fecha_dt(_align_required_columns(pd.DataFrame(), EG_REQUIRED))
     df = _align_required_columns(df, EG_REQUIRED)
     df = _to_numeric(df, ["Monto"])
-    for c in ["Egreso_ID", "Fecha", "Concepto", "Categoria", "Notas", "Drop"]:
-        df[c] = df[c].astype(str).fillna("").str.strip()
-    return df
+    df = _to_str(df, ["Egreso_ID", "Fecha", "Concepto", "Categoria", "Notas", "Drop"])
+    return _with_fecha_dt(df)
+
+
+@st.cache_data(ttl=45, show_spinner=False)
+def _cached_egresos(_conn: GSheetsConnection, ttl_s: int, version: int) -> pd.DataFrame:
+    return _prepare_egresos(load_raw_sheet(_conn, SHEET_EGRESOS, ttl_s=ttl_s))
+
+
+def load_egresos(conn: GSheetsConnection, ttl_s: int = 60) -> pd.DataFrame:
+    if ttl_s is not None and int(ttl_s) <= 0:
+        return _prepare_egresos(load_raw_sheet(conn, SHEET_EGRESOS, ttl_s=0))
+    return _cached_egresos(conn, int(ttl_s or 60), sheet_version(SHEET_EGRESOS))
 
 
 def _next_egreso_id(eg_df: pd.DataFrame, tz: str = "America/El_Salvador") -> str:
@@ -286,17 +851,12 @@ def _next_egreso_id(eg_df: pd.DataFrame, tz: str = "America/El_Salvador") -> str
     prefix = f"E-{year}-"
     if eg_df is None or eg_df.empty or "Egreso_ID" not in eg_df.columns:
         return f"{prefix}0001"
-    nums = []
-    for v in eg_df["Egreso_ID"].astype(str).tolist():
-        v = v.strip()
-        if not v.startswith(prefix):
-            continue
-        tail = v.replace(prefix, "")
-        try:
-            nums.append(int(tail))
-        except Exception:
-            pass
-    n = (max(nums) + 1) if nums else 1
+    # Correlativo del año en una sola pasada de regex sobre la columna (sin loop por fila)
+    nums = pd.to_numeric(
+        eg_df["Egreso_ID"].astype(str).str.strip().str.extract(rf"^{prefix}(\d+)$", expand=False),
+        errors="coerce",
+    )
+    n = int(nums.max()) + 1 if nums.notna().any() else 1
     return f"{prefix}{n:04d}"
 
 
@@ -322,33 +882,40 @@ def parse_catalogos(df: pd.DataFrame) -> dict[str, list[dict[str, str]]]:
     if df is None or df.empty:
         return {"drops": [], "colores": []}
 
-    work = df.copy()
-
-    if "Catalogo" in work.columns:
-        work["Catalogo"] = work["Catalogo"].ffill()
-
-    for col in ["Catalogo", "Valor", "Codigo"]:
-        if col in work.columns:
-            work[col] = work[col].astype(str).str.strip()
+    # Copia propia con las 3 columnas garantizadas (las que falten quedan vacías)
+    work = _align_required_columns(df, ["Catalogo", "Valor", "Codigo"])
+    work["Catalogo"] = work["Catalogo"].ffill()
+    cols = ["Catalogo", "Valor", "Codigo"]
+    work[cols] = work[cols].astype(str).fillna("").apply(lambda s: s.str.strip())
+    cat_upper = work["Catalogo"].str.upper()
 
     def _pick(cat: str) -> list[dict[str, str]]:
-        sub = work[work.get("Catalogo", "").str.upper() == cat.upper()].copy()
+        sub = work[cat_upper == cat.upper()]
+        sub = sub[sub["Valor"].ne("")]
         if sub.empty:
             return []
-        out = []
-        for _, r in sub.iterrows():
-            valor = (r.get("Valor") or "").strip()
-            codigo = (r.get("Codigo") or "").strip()
-            if not valor:
-                continue
-            if not codigo or codigo.lower() == "nan":
-                codigo = re.sub(r"\s+", "", valor).upper()
-            out.append({"valor": valor, "codigo": codigo})
-        return out
+        valor = sub["Valor"]
+        codigo = sub["Codigo"]
+        # Sin código -> se deriva del valor (sin espacios, en mayúsculas)
+        sin_codigo = codigo.eq("") | codigo.str.lower().eq("nan")
+        codigo = codigo.mask(sin_codigo, valor.str.replace(_WS_RE, "", regex=True).str.upper())
+        return [{"valor": v, "codigo": c} for v, c in zip(valor, codigo)]
 
     return {"drops": _pick("DROP"), "colores": _pick("COLOR")}
 
 
+@st.cache_data(ttl=600, show_spinner=False)
+def _cached_catalogos_parsed(_conn: GSheetsConnection, ttl_s: int, version: int) -> dict[str, list[dict[str, str]]]:
+    return parse_catalogos(load_catalogos(_conn, ttl_s=ttl_s))
+
+
+def load_catalogos_parsed(conn: GSheetsConnection, ttl_s: int = 600) -> dict[str, list[dict[str, str]]]:
+    """parse_catalogos(load_catalogos(...)) cacheado: se re-parsea solo cuando cambia la hoja."""
+    if ttl_s is not None and int(ttl_s) <= 0:
+        return parse_catalogos(load_catalogos(conn, ttl_s=0))
+    return _cached_catalogos_parsed(conn, int(ttl_s or 600), sheet_version(SHEET_CATALOGOS))
+
+
 def _strip_accents(s: str) -> str:
     s = str(s or "")
     return "".join(
@@ -356,29 +923,33 @@ def _strip_accents(s: str) -> str:
     )
 
 
+@lru_cache(maxsize=1024)
 def _slug_upper(s: str) -> str:
     s = _strip_accents(s).upper().strip()
-    s = re.sub(r"[^A-Z0-9\s\-]", " ", s)
-    s = re.sub(r"\s+", " ", s).strip()
+    s = _SLUG_DROP_RE.sub(" ", s)
+    s = _WS_RE.sub(" ", s).strip()
     return s
 
 
+_CODE_STOPWORDS = frozenset({"T-SHIRT", "TSHIRT", "TEE", "SHIRT"})
+_CODE_CHARS = frozenset("BCDFGHJKLMNPQRSTVWXYZ0123456789")
+
+
+@lru_cache(maxsize=1024)
 def suggest_product_code(product_name: str) -> str:
     """Sugiere un código de 3 letras tipo PSY / BSC."""
     s = _slug_upper(product_name)
     if not s:
         return "PRD"
 
-    stop = {"T-SHIRT", "TSHIRT", "TEE", "SHIRT"}
-    words = [w for w in s.replace("-", " ").split() if w and w not in stop]
+    words = [w for w in s.replace("-", " ").split() if w and w not in _CODE_STOPWORDS]
     if not words:
         words = s.replace("-", " ").split()
 
-    consonants = "BCDFGHJKLMNPQRSTVWXYZ0123456789"
     code = ""
     for w in words:
         for ch in w:
-            if ch in consonants:
+            if ch in _CODE_CHARS:
                 code += ch
             if len(code) >= 3:
                 break
@@ -393,39 +964,65 @@ def build_sku(drop_code: str, prod_code: str, color_code: str, size_code: str) -
     return f"{drop_code}-{prod_code}-{color_code}-{size_code}".upper()
 
 
-def get_existing_product_code(inv_df: pd.DataFrame, product_name: str) -> str | None:
-    """Si el producto ya existe, intenta respetar su código (2do segmento del SKU)."""
+def build_product_codes(inv_df: pd.DataFrame) -> dict[str, str]:
+    """{Producto: código} con el código más usado (2do segmento del SKU) de cada producto."""
+    if inv_df is None or inv_df.empty or "Producto" not in inv_df.columns:
+        return {}
+    # Solo el 2do segmento (sin armar el split completo de 4 columnas); SKUs sin "-" quedan fuera
+    codes = inv_df["SKU"].astype(str).str.extract(_SKU_PROD_CODE_RE, expand=False).str.strip()
+    pairs = pd.DataFrame({"Producto": inv_df["Producto"].astype(str), "Codigo": codes}).dropna()
+    if pairs.empty:
+        return {}
+    top = pairs.groupby("Producto", sort=False)["Codigo"].agg(lambda s: s.value_counts().index[0])
+    return top.to_dict()
+
+
+@st.cache_data(show_spinner=False)
+def product_codes(inv_df: pd.DataFrame) -> dict[str, str]:
+    """build_product_codes cacheado por contenido del DataFrame (se arma una vez por carga)."""
+    return build_product_codes(inv_df)
+
+
+@st.cache_data(show_spinner=False)
+def inventory_skus(inv_df: pd.DataFrame) -> frozenset[str]:
+    """SKUs ya normalizados (strip) del inventario, cacheados por contenido del DataFrame."""
     if inv_df is None or inv_df.empty:
-        return None
-    sub = inv_df[inv_df.get("Producto", "") == product_name]
-    if sub.empty:
-        return None
+        return frozenset()
+    return frozenset(inv_df["SKU"].astype(str).str.strip().tolist())
 
-    segs = sub["SKU"].astype(str).str.split("-", n=3, expand=True)
-    if segs.shape[1] < 2:
-        return None
 
-    prod_codes = segs[1].dropna().astype(str).str.strip()
-    if prod_codes.empty:
+def get_existing_product_code(inv_df: pd.DataFrame, product_name: str) -> str | None:
+    """Si el producto ya existe, intenta respetar su código (2do segmento del SKU)."""
+    if inv_df is None or inv_df.empty:
         return None
-    return prod_codes.value_counts().index[0]
+    return product_codes(inv_df).get(product_name)
 
 
-def ensure_unique_skus(new_skus: list[str], existing: set[str]) -> tuple[bool, list[str]]:
+def ensure_unique_skus(new_skus: list[str], existing: set[str] | frozenset[str]) -> tuple[bool, list[str]]:
     dups = [s for s in new_skus if s in existing]
     return (len(dups) == 0, dups)
 
 
-def size_sort_key(s: str) -> int:
-    order = ["XS", "S", "M", "L", "XL", "XXL", "XXXL", "OS"]
-    s = str(s or "").upper().strip()
-    return order.index(s) if s in order else 999
+# Posición de cada talla conocida; las que no estén van al final (999)
+_SIZE_ORDER: dict[str, int] = {t: i for i, t in enumerate(TALLAS_BASE)}
 
 
-def load_cabecera(conn: GSheetsConnection, ttl_s: int = 60) -> pd.DataFrame:
-    df = load_raw_sheet(conn, SHEET_VENTAS_CAB, ttl_s=ttl_s)
+def size_sort_key(s: Any) -> Any:
+    """Clave de orden de talla. Acepta un valor suelto o una Serie completa (p. ej. `sort_values(key=...)`)."""
+    if isinstance(s, pd.Series):
+        return s.astype(str).str.upper().str.strip().map(_SIZE_ORDER).fillna(999).astype(int)
+    return _SIZE_ORDER.get(str(s or "").upper().strip(), 999)
+
+
+def _with_fecha_dt(df: pd.DataFrame) -> pd.DataFrame:
+    """`_Fecha_dt` parseada una vez en el loader cacheado (cache=True: fechas repetidas se parsean una vez)."""
+    df["_Fecha_dt"] = pd.to_datetime(df["Fecha"], errors="coerce", dayfirst=True, cache=True)
+    return df
+
+
+def _prepare_cabecera(df: pd.DataFrame) -> pd.DataFrame:
     if df.empty:
-        return _align_required_columns(pd.DataFrame(), CAB_REQUIRED)
+        return _with_fecha_dt(_align_required_columns(pd.DataFrame(), CAB_REQUIRED))
 
     df = _align_required_columns(df, CAB_REQUIRED)
     df = _to_numeric(
@@ -440,23 +1037,44 @@ def load_cabecera(conn: GSheetsConnection, ttl_s: int = 60) -> pd.DataFrame:
             "Monto_A_Recibir",
         ],
     )
-    for c in ["Venta_ID", "Fecha", "Hora", "Cliente", "Metodo_Pago", "Notas", "Estado"]:
-        df[c] = df[c].astype(str).fillna("").str.strip()
-    return df
+    df = _to_str(df, ["Venta_ID", "Fecha", "Hora", "Cliente", "Metodo_Pago", "Notas", "Estado"])
+    df[["Metodo_Pago", "Estado"]] = df[["Metodo_Pago", "Estado"]].astype("category")
+    return _with_fecha_dt(df)
 
 
-def load_detalle(conn: GSheetsConnection, ttl_s: int = 60) -> pd.DataFrame:
-    df = load_raw_sheet(conn, SHEET_VENTAS_DET, ttl_s=ttl_s)
+@st.cache_data(ttl=45, show_spinner=False)
+def _cached_cabecera(_conn: GSheetsConnection, ttl_s: int, version: int) -> pd.DataFrame:
+    return _prepare_cabecera(load_raw_sheet(_conn, SHEET_VENTAS_CAB, ttl_s=ttl_s))
+
+
+def load_cabecera(conn: GSheetsConnection, ttl_s: int = 60) -> pd.DataFrame:
+    if ttl_s is not None and int(ttl_s) <= 0:
+        return _prepare_cabecera(load_raw_sheet(conn, SHEET_VENTAS_CAB, ttl_s=0))
+    return _cached_cabecera(conn, int(ttl_s or 60), sheet_version(SHEET_VENTAS_CAB))
+
+
+def _prepare_detalle(df: pd.DataFrame) -> pd.DataFrame:
     if df.empty:
         return _align_required_columns(pd.DataFrame(), DET_REQUIRED)
 
     df = _align_required_columns(df, DET_REQUIRED)
     df = _to_numeric(df, ["Linea", "Cantidad", "Precio_Unitario", "Descuento_Unitario", "Subtotal_Linea"])
-    for c in ["Venta_ID", "SKU", "Producto", "Drop", "Color", "Talla", "Bodega_Salida"]:
-        df[c] = df[c].astype(str).fillna("").str.strip()
+    df = _to_str(df, ["Venta_ID", "SKU", "Producto", "Drop", "Color", "Talla", "Bodega_Salida"])
+    df["Bodega_Salida"] = df["Bodega_Salida"].astype("category")
     return df
 
 
+@st.cache_data(ttl=45, show_spinner=False)
+def _cached_detalle(_conn: GSheetsConnection, ttl_s: int, version: int) -> pd.DataFrame:
+    return _prepare_detalle(load_raw_sheet(_conn, SHEET_VENTAS_DET, ttl_s=ttl_s))
+
+
+def load_detalle(conn: GSheetsConnection, ttl_s: int = 60) -> pd.DataFrame:
+    if ttl_s is not None and int(ttl_s) <= 0:
+        return _prepare_detalle(load_raw_sheet(conn, SHEET_VENTAS_DET, ttl_s=0))
+    return _cached_detalle(conn, int(ttl_s or 60), sheet_version(SHEET_VENTAS_DET))
+
+
 def load_inversiones(conn: GSheetsConnection, ttl_s: int = 180) -> pd.DataFrame:
     df = load_raw_sheet(conn, SHEET_INVERSIONES, ttl_s=ttl_s)
     if df.empty:
@@ -464,8 +1082,7 @@ def load_inversiones(conn: GSheetsConnection, ttl_s: int = 180) -> pd.DataFrame:
 
     df = _align_required_columns(df, INVEST_REQUIRED)
     df = _to_numeric(df, ["Monto_Invertido"])
-    for c in ["Tipo", "Referencia", "Notas"]:
-        df[c] = df[c].astype(str).fillna("").str.strip()
+    df = _to_str(df, ["Tipo", "Referencia", "Notas"])
 
     df["Tipo"] = df["Tipo"].str.upper()
     return df
@@ -474,33 +1091,46 @@ def load_inversiones(conn: GSheetsConnection, ttl_s: int = 180) -> pd.DataFrame:
 # -----------------------------
 # Venta_ID secuencial (V-YYYY-0001)
 # -----------------------------
-def next_venta_id(cab_df: pd.DataFrame, year: int) -> str:
-    pat = re.compile(r"^V-(\d{4})-(\d{4})$")
-    max_n = 0
+def next_venta_id(cab_df: pd.DataFrame, year: int, min_n: int = 0) -> str:
+    """min_n: último correlativo ya emitido en esta sesión (por si la lectura cacheada va atrasada)."""
+    max_n = int(min_n or 0)
     if "Venta_ID" not in cab_df.columns:
-        return f"V-{year}-0001"
-
-    for vid in cab_df["Venta_ID"].astype(str).tolist():
-        m = pat.match(vid.strip())
-        if not m:
-            continue
-        y = int(m.group(1))
-        n = int(m.group(2))
-        if y == year and n > max_n:
-            max_n = n
+        return f"V-{year}-{max_n + 1:04d}"
+
+    # Año y correlativo en una sola pasada de regex sobre la columna (sin loop por fila)
+    parts = cab_df["Venta_ID"].astype(str).str.strip().str.extract(_VENTA_ID_RE)
+    nums = pd.to_numeric(parts[1][parts[0] == str(year)], errors="coerce")
+    if nums.notna().any():
+        max_n = max(max_n, int(nums.max()))
     return f"V-{year}-{max_n + 1:04d}"
 
 
 # -----------------------------
 # Comisiones
 # -----------------------------
+# método de pago normalizado -> (clave en Config, porcentaje por defecto)
+_COMISION_CFG: dict[str, tuple[str, float]] = {
+    "tarjeta": ("COMISION_TARJETA_PORC", 0.023),
+    "contra entrega": ("COMISION_PCE_PORC", 0.0299),
+}
+
+
+@lru_cache(maxsize=64)
+def _cfg_rate(raw: Any) -> float:
+    """Porcentaje de Config ya parseado; el valor crudo casi nunca cambia entre reruns."""
+    return float(_clean_number(raw))
+
+
 def comision_porcentaje(metodo_pago: str, cfg: dict[str, Any], override_pce: float | None) -> float:
     m = (metodo_pago or "").strip().lower()
-    tarjeta = _clean_number(cfg.get("COMISION_TARJETA_PORC", 0.023))
-    pce = _clean_number(cfg.get("COMISION_PCE_PORC", 0.0299))
-
-    if m == "tarjeta":
-        return float(tarjeta)
-    if m == "contra entrega":
-        return float(override_pce) if override_pce is not None else float(pce)
-    return 0.0
\ No newline at end of file
+    spec = _COMISION_CFG.get(m)
+    if spec is None:
+        return 0.0
+    if m == "contra entrega" and override_pce is not None:
+        return float(override_pce)
+    key, default = spec
+    raw = cfg.get(key, default)
+    try:
+        return _cfg_rate(raw)
+    except TypeError:  # valor no hasheable
+        return float(_clean_number(raw))
\ No newline at end of file
@@ -7,15 +7,23 @@ from datetime import datetime
 import pandas as pd
 import streamlit as st
 
-from modules.data.helpers import load_cabecera, load_detalle, load_egresos, load_inversiones
+from modules.data.helpers import clear_prefetch, load_cabecera, load_detalle, load_egresos, load_inversiones
+from modules.ui.styles import compact_css, money
 
 
 def _esc(v: object) -> str:
     return html.escape(str(v))
 
 
-def _inject_dash_css() -> None:
-    st.markdown("""
+def _as_float(s: pd.Series) -> pd.Series:
+    # Los loaders ya entregan estas columnas como float: solo se re-parsea lo que llegue como texto
+    if pd.api.types.is_numeric_dtype(s):
+        return s.astype(float).fillna(0.0)
+    return pd.to_numeric(s, errors="coerce").fillna(0.0)
+
+
+# CSS de la página compactado una sola vez al importar; cada rerun solo lo re-emite
+_DASH_CSS = compact_css("""
     <style>
       .dash-header {
         font-size: 2rem;
@@ -332,29 +340,33 @@ def _inject_dash_css() -> None:
         margin-top: 2px;
       }
     </style>
-    """, unsafe_allow_html=True)
+    """)
 
 
-def _money(x: float) -> str:
-    try:
-        return f"${float(x):,.2f}"
-    except Exception:
-        return "$0.00"
+def _inject_dash_css() -> None:
+    st.markdown(_DASH_CSS, unsafe_allow_html=True)
+
+
+_money = money
 
 
 _VENTA_ID_RE = re.compile(r"^V-(\d{4})-(\d+)$")
 
 
-def _order_sort_key(venta_id: str) -> tuple[int, int]:
+def _order_sort_keys(venta_ids: pd.Series) -> pd.DataFrame:
     """
-    Ordena por año y correlativo del Venta_ID (V-YYYY-NNNN), que refleja
-    el orden real de REGISTRO (no depende de que 'Fecha' esté bien tipeada).
-    Si el ID no matchea el patrón, cae al final.
+    Claves de orden (año, correlativo) del Venta_ID (V-YYYY-NNNN) para toda la columna de una vez,
+    que reflejan el orden real de REGISTRO (no depende de que 'Fecha' esté bien tipeada).
+    Si el ID no matchea el patrón, queda (0, 0) y cae al final.
     """
-    m = _VENTA_ID_RE.match(str(venta_id).strip())
-    if not m:
-        return (0, 0)
-    return (int(m.group(1)), int(m.group(2)))
+    parts = venta_ids.astype(str).str.strip().str.extract(_VENTA_ID_RE)
+    return pd.DataFrame(
+        {
+            "_SortY": pd.to_numeric(parts[0], errors="coerce").fillna(0).astype(int),
+            "_SortN": pd.to_numeric(parts[1], errors="coerce").fillna(0).astype(int),
+        },
+        index=venta_ids.index,
+    )
 
 
 def _order_products_summary(det_df: pd.DataFrame, venta_id: str, max_items: int = 3) -> str:
@@ -367,11 +379,12 @@ def _order_products_summary(det_df: pd.DataFrame, venta_id: str, max_items: int
         return "—"
 
     parts: list[str] = []
-    for _, r in lines.iterrows():
-        qty   = int(pd.to_numeric(r.get("Cantidad", 0), errors="coerce") or 0)
-        prod  = str(r.get("Producto", "")).strip() or "Producto"
-        color = str(r.get("Color", "")).strip()
-        talla = str(r.get("Talla", "")).strip()
+    cols = lines[["Cantidad", "Producto", "Color", "Talla"]]
+    for qty, prod, color, talla in cols.itertuples(index=False, name=None):
+        qty   = int(pd.to_numeric(qty, errors="coerce") or 0)
+        prod  = str(prod).strip() or "Producto"
+        color = str(color).strip()
+        talla = str(talla).strip()
 
         detail = f"{qty}× {prod}"
         extras = [x for x in [color, talla] if x and x.upper() not in ("STANDARD", "OS", "N/A", "")]
@@ -442,23 +455,23 @@ def render_dashboard_page(conn, inv_df_full, APP_TZ) -> None:
     # ── Coerce numerics ──────────────────────────────────────────────────────
     for col in ["Total_Cobrado", "Monto_A_Recibir", "Costo_Logistica_Total", "Comision_Monto"]:
         if not cab_df.empty and col in cab_df.columns:
-            cab_df[col] = pd.to_numeric(cab_df[col], errors="coerce").fillna(0.0)
+            cab_df[col] = _as_float(cab_df[col])
 
     if not det_df.empty:
         for col in ["Cantidad", "Subtotal_Linea", "Precio_Unitario", "Descuento_Unitario"]:
             if col in det_df.columns:
-                det_df[col] = pd.to_numeric(det_df[col], errors="coerce").fillna(0.0)
+                det_df[col] = _as_float(det_df[col])
 
     if not egr_df.empty and "Monto" in egr_df.columns:
-        egr_df["Monto"] = pd.to_numeric(egr_df["Monto"], errors="coerce").fillna(0.0)
+        egr_df["Monto"] = _as_float(egr_df["Monto"])
 
     if not inv_df.empty:
         for col in ["Stock_Casa", "Stock_Bodega", "Costo_Unitario", "Precio_Lista"]:
             if col in inv_df.columns:
-                inv_df[col] = pd.to_numeric(inv_df[col], errors="coerce").fillna(0.0)
+                inv_df[col] = _as_float(inv_df[col])
 
     if not invst_df.empty:
-        invst_df["Monto_Invertido"] = pd.to_numeric(invst_df["Monto_Invertido"], errors="coerce").fillna(0.0)
+        invst_df["Monto_Invertido"] = _as_float(invst_df["Monto_Invertido"])
 
     if not cab_df.empty:
         cab_df["_Fecha_dt"] = _parse_fecha_series(cab_df)
@@ -492,6 +505,7 @@ def render_dashboard_page(conn, inv_df_full, APP_TZ) -> None:
     with h2:
         if st.button("🔄 Refrescar", use_container_width=True):
             st.cache_data.clear()
+            clear_prefetch()  # la copia agrupada no vive en st.cache_data
             st.rerun()
 
     # ── KPI tiles ────────────────────────────────────────────────────────────
@@ -545,10 +559,9 @@ def render_dashboard_page(conn, inv_df_full, APP_TZ) -> None:
 
         N_SHOW = 10  # <- cambiá este número si querés mostrar más/menos
 
-        cab_sorted = cab_df.copy()
-        cab_sorted["_SortKey"] = cab_sorted["Venta_ID"].apply(_order_sort_key)
-        cab_sorted = cab_sorted.sort_values("_SortKey", ascending=False)
-        last_orders = cab_sorted.head(N_SHOW)
+        # Top-N parcial (nlargest) en vez de ordenar todas las órdenes para quedarse con N
+        cab_keyed = cab_df.join(_order_sort_keys(cab_df["Venta_ID"]))
+        last_orders = cab_keyed.nlargest(N_SHOW, ["_SortY", "_SortN"])
 
         pay_colors = {
             "efectivo": "#3fff8b",
@@ -565,16 +578,22 @@ def render_dashboard_page(conn, inv_df_full, APP_TZ) -> None:
             "cancelado": "#ff6b6b",
         }
 
-        order_rows = ""
-        for _, o in last_orders.iterrows():
-            vid     = str(o.get("Venta_ID", ""))
-            fecha   = str(o.get("Fecha", "")).strip()
-            hora    = str(o.get("Hora", "")).strip()
-            cliente = str(o.get("Cliente", "")).strip() or "—"
-            metodo  = str(o.get("Metodo_Pago", "")).strip()
-            estado  = str(o.get("Estado", "")).strip() or "COMPLETADA"
-            total   = float(pd.to_numeric(o.get("Total_Cobrado", 0), errors="coerce") or 0)
-            neto    = float(pd.to_numeric(o.get("Monto_A_Recibir", 0), errors="coerce") or 0)
+        # Todas las órdenes se arman en un solo string y se emiten en UN st.markdown
+        order_cols = [
+            "Venta_ID", "Fecha", "Hora", "Cliente", "Metodo_Pago", "Estado", "Total_Cobrado", "Monto_A_Recibir",
+        ]
+        order_rows: list[str] = []
+        for vid, fecha, hora, cliente, metodo, estado, total, neto in last_orders[order_cols].itertuples(
+            index=False, name=None
+        ):
+            vid     = str(vid)
+            fecha   = str(fecha).strip()
+            hora    = str(hora).strip()
+            cliente = str(cliente).strip() or "—"
+            metodo  = str(metodo).strip()
+            estado  = str(estado).strip() or "COMPLETADA"
+            total   = float(total)
+            neto    = float(neto)
 
             pay_color = pay_colors.get(metodo.lower(), "#a0a0a0")
             est_color = estado_colors.get(estado.lower(), "#a0a0a0")
@@ -582,7 +601,7 @@ def render_dashboard_page(conn, inv_df_full, APP_TZ) -> None:
             products_str = _order_products_summary(det_df, vid)
             meta_str = " · ".join(x for x in [fecha, hora] if x)
 
-            order_rows += f"""
+            order_rows.append(f"""
             <div class="dash-order-item">
               <div class="dash-order-left">
                 <div class="dash-order-topline">
@@ -597,10 +616,10 @@ def render_dashboard_page(conn, inv_df_full, APP_TZ) -> None:
                 <span class="dash-order-total">{_money(total)}</span>
                 <span class="dash-order-net">Neto: {_money(neto)}</span>
               </div>
-            </div>"""
+            </div>""")
 
-        st.markdown(f'<div class="dash-order-list">{order_rows}</div>', unsafe_allow_html=True)
         st.markdown(
+            f'<div class="dash-order-list">{"".join(order_rows)}</div>'
             f'<div style="font-size:0.62rem;color:#555;margin-top:6px;margin-bottom:4px">'
             f'Mostrando {len(last_orders)} de {len(cab_df)} órdenes registradas</div>',
             unsafe_allow_html=True,
@@ -619,29 +638,29 @@ def render_dashboard_page(conn, inv_df_full, APP_TZ) -> None:
         )
 
         max_t = float(monthly["Total"].max()) if not monthly.empty else 1.0
-        bars  = ""
-        for _, row in monthly.iterrows():
-            pct   = (float(row["Total"]) / max_t * 100) if max_t > 0 else 0
-            label = _month_label_es(str(row["_Month"]))
-            bars += f"""
+        bars: list[str] = []
+        for month, total_m, n_m in monthly[["_Month", "Total", "N"]].itertuples(index=False, name=None):
+            pct   = (float(total_m) / max_t * 100) if max_t > 0 else 0
+            label = _month_label_es(str(month))
+            bars.append(f"""
             <div class="dash-bar-row">
               <div class="dash-bar-header">
                 <span>{_esc(label)}</span>
-                <span>{_money(float(row["Total"]))} &nbsp;·&nbsp; {int(row["N"])} vtas</span>
+                <span>{_money(float(total_m))} &nbsp;·&nbsp; {int(n_m)} vtas</span>
               </div>
               <div class="dash-bar-track">
                 <div class="dash-bar-fill" style="width:{pct:.1f}%"></div>
               </div>
-            </div>"""
+            </div>""")
 
-        st.markdown(f'<div class="dash-card">{bars}</div>', unsafe_allow_html=True)
+        st.markdown(f'<div class="dash-card">{"".join(bars)}</div>', unsafe_allow_html=True)
 
     # ── Top productos ─────────────────────────────────────────────────────────
     if not det_df.empty:
         st.markdown('<div class="dash-section">Top Productos por Ingresos</div>', unsafe_allow_html=True)
 
         sku_cost = (
-            inv_df[["SKU", "Costo_Unitario"]].copy()
+            inv_df[["SKU", "Costo_Unitario"]]
             if not inv_df.empty and "SKU" in inv_df.columns
             else pd.DataFrame(columns=["SKU", "Costo_Unitario"])
         )
@@ -652,23 +671,24 @@ def render_dashboard_page(conn, inv_df_full, APP_TZ) -> None:
         top = (
             lines.groupby("Producto", as_index=False)
             .agg(Ingresos=("Subtotal_Linea", "sum"), Uds=("Cantidad", "sum"), COGS=("COGS", "sum"))
-            .sort_values("Ingresos", ascending=False)
-            .head(5)
-        )
-        top["Margen"] = top.apply(
-            lambda r: f"{(r['Ingresos']-r['COGS'])/r['Ingresos']*100:.0f}%" if r["Ingresos"] > 0 else "—",
-            axis=1,
+            .nlargest(5, "Ingresos")
         )
+        con_ingresos = top["Ingresos"] > 0
+        margen_pct = ((top["Ingresos"] - top["COGS"]) / top["Ingresos"].where(con_ingresos) * 100).round()
+        top["Margen"] = (margen_pct.fillna(0).astype(int).astype(str) + "%").where(con_ingresos, "—")
 
-        items = ""
-        for i, (_, r) in enumerate(top.iterrows(), 1):
-            items += f"""
+        items = "".join(
+            f"""
             <div class="dash-prod-item">
               <span class="dash-prod-rank">{i:02d}</span>
-              <span class="dash-prod-name">{_esc(r["Producto"])}</span>
-              <span class="dash-prod-units">{int(r["Uds"])} uds&nbsp;·&nbsp;{r["Margen"]}</span>
-              <span class="dash-prod-revenue">{_money(float(r["Ingresos"]))}</span>
+              <span class="dash-prod-name">{_esc(prod)}</span>
+              <span class="dash-prod-units">{int(uds)} uds&nbsp;·&nbsp;{margen}</span>
+              <span class="dash-prod-revenue">{_money(float(ingresos))}</span>
             </div>"""
+            for i, (prod, uds, margen, ingresos) in enumerate(
+                top[["Producto", "Uds", "Margen", "Ingresos"]].itertuples(index=False, name=None), 1
+            )
+        )
 
         st.markdown(f'<div class="dash-prod-list">{items}</div>', unsafe_allow_html=True)
 
@@ -680,14 +700,14 @@ def render_dashboard_page(conn, inv_df_full, APP_TZ) -> None:
         stock_valor = float((inv_df["Stock_Total"] * inv_df["Costo_Unitario"]).sum())
         agotados    = int((inv_df["Stock_Total"] == 0).sum())
 
-        drops = inv_df.groupby("Drop", as_index=False)["Stock_Total"].sum().sort_values("Drop")
+        drops = inv_df.groupby("Drop", as_index=False, observed=True)["Stock_Total"].sum().sort_values("Drop")
         drop_tiles = "".join(
             f"""<div class="dash-stock-tile">
-              <span class="dash-stock-drop">{_esc(row["Drop"])}</span>
-              <span class="dash-stock-num">{int(row["Stock_Total"])}</span>
+              <span class="dash-stock-drop">{_esc(drop)}</span>
+              <span class="dash-stock-num">{int(stock)}</span>
               <span class="dash-stock-label">uds</span>
             </div>"""
-            for _, row in drops.iterrows()
+            for drop, stock in drops[["Drop", "Stock_Total"]].itertuples(index=False, name=None)
         )
 
         agotados_color = "#ff6b6b" if agotados > 0 else "#3fff8b"
@@ -732,10 +752,10 @@ def render_dashboard_page(conn, inv_df_full, APP_TZ) -> None:
 
         inv_drops = invst_df[invst_df["Tipo"].astype(str).str.upper().str.strip() == "DROP"].copy()
 
-        inv_rows = ""
-        for _, row in inv_drops.iterrows():
-            dr       = str(row["Referencia"]).strip()
-            inversion = float(row["Monto_Invertido"])
+        inv_rows: list[str] = []
+        for dr, inversion in inv_drops[["Referencia", "Monto_Invertido"]].itertuples(index=False, name=None):
+            dr       = str(dr).strip()
+            inversion = float(inversion)
             neto_dr  = float(drop_neto.get(dr, 0.0))
             pct      = min(100.0, (neto_dr / inversion * 100)) if inversion > 0 else 0.0
             faltante = max(0.0, inversion - neto_dr)
@@ -745,7 +765,7 @@ def render_dashboard_page(conn, inv_df_full, APP_TZ) -> None:
                 if faltante <= 0
                 else f'<div style="font-size:0.6rem;color:#666;margin-top:3px">Faltante: {_money(faltante)}</div>'
             )
-            inv_rows += f"""
+            inv_rows.append(f"""
             <div class="dash-inv-row">
               <div class="dash-inv-header">
                 <span class="dash-inv-drop">Drop {_esc(dr)}</span>
@@ -759,39 +779,39 @@ def render_dashboard_page(conn, inv_df_full, APP_TZ) -> None:
                 <span>Inversión: {_money(inversion)}</span>
               </div>
               {nota}
-            </div>"""
+            </div>""")
 
         if inv_rows:
-            st.markdown(f'<div class="dash-card">{inv_rows}</div>', unsafe_allow_html=True)
+            st.markdown(f'<div class="dash-card">{"".join(inv_rows)}</div>', unsafe_allow_html=True)
 
     # ── Métodos de pago ───────────────────────────────────────────────────────
     if not cab_df.empty and "Metodo_Pago" in cab_df.columns:
         st.markdown('<div class="dash-section">Métodos de Pago</div>', unsafe_allow_html=True)
         pay = (
-            cab_df.groupby("Metodo_Pago", as_index=False)["Total_Cobrado"]
+            cab_df.groupby("Metodo_Pago", as_index=False, observed=True)["Total_Cobrado"]
             .sum()
             .sort_values("Total_Cobrado", ascending=False)
         )
         pay_total = float(pay["Total_Cobrado"].sum())
         colors = ["#3fff8b", "#60b4ff", "#ffd166", "#ff6b9d", "#c084fc"]
 
-        pay_rows = ""
-        for i, (_, pm) in enumerate(pay.iterrows()):
-            monto = float(pm["Total_Cobrado"])
+        pay_rows: list[str] = []
+        for i, (metodo, monto) in enumerate(pay[["Metodo_Pago", "Total_Cobrado"]].itertuples(index=False, name=None)):
+            monto = float(monto)
             pct   = (monto / pay_total * 100) if pay_total > 0 else 0
             color = colors[i % len(colors)]
-            pay_rows += f"""
+            pay_rows.append(f"""
             <div class="dash-pay-row">
               <div class="dash-pay-header">
-                <span>{_esc(pm["Metodo_Pago"])}</span>
+                <span>{_esc(metodo)}</span>
                 <span>{_money(monto)} <span class="dash-pay-pct">({pct:.1f}%)</span></span>
               </div>
               <div class="dash-pay-track">
                 <div class="dash-pay-fill" style="width:{pct:.1f}%;background:{color}"></div>
               </div>
-            </div>"""
+            </div>""")
 
-        st.markdown(f'<div class="dash-card">{pay_rows}</div>', unsafe_allow_html=True)
+        st.markdown(f'<div class="dash-card">{"".join(pay_rows)}</div>', unsafe_allow_html=True)
 
     # ── Egresos por categoría ─────────────────────────────────────────────────
     if not egr_df.empty and "Categoria" in egr_df.columns and total_egresos > 0:
@@ -801,17 +821,17 @@ def render_dashboard_page(conn, inv_df_full, APP_TZ) -> None:
             .sum()
             .sort_values("Monto", ascending=False)
         )
-        egr_rows = ""
-        for _, ec in egr_cat.iterrows():
-            monto = float(ec["Monto"])
+        egr_rows: list[str] = []
+        for categoria, monto in egr_cat[["Categoria", "Monto"]].itertuples(index=False, name=None):
+            monto = float(monto)
             pct   = (monto / total_egresos * 100) if total_egresos > 0 else 0
-            egr_rows += f"""
+            egr_rows.append(f"""
             <div class="dash-egr-item">
-              <span class="dash-egr-cat">{_esc(ec["Categoria"])}</span>
+              <span class="dash-egr-cat">{_esc(categoria)}</span>
               <div style="text-align:right">
                 <span class="dash-egr-amount">{_money(monto)}</span>
                 <span style="font-size:0.6rem;color:#555;margin-left:6px">{pct:.1f}%</span>
               </div>
-            </div>"""
+            </div>""")
 
-        st.markdown(f'<div class="dash-card">{egr_rows}</div>', unsafe_allow_html=True)
+        st.markdown(f'<div class="dash-card">{"".join(egr_rows)}</div>', unsafe_allow_html=True)
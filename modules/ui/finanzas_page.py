@@ -4,18 +4,19 @@ from datetime import datetime
 from math import ceil
 import html
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 
-from modules.data.helpers import load_cabecera, load_detalle, load_inversiones
+from modules.data.helpers import clear_prefetch, load_cabecera, load_detalle, load_inversiones
+from modules.ui.styles import compact_css
 
 
 # --------------------------------------------------
 # CSS específico de Finanzas
 # --------------------------------------------------
-def _inject_finanzas_css() -> None:
-    st.markdown(
-        """
+# CSS de la página compactado una sola vez al importar; cada rerun solo lo re-emite
+_FIN_CSS = compact_css("""
         <style>
           .fin-card, .fin-card-low {
             background: transparent;
@@ -275,9 +276,26 @@ def _inject_finanzas_css() -> None:
             padding: 8px 0 12px 0;
           }
         </style>
-        """,
-        unsafe_allow_html=True,
-    )
+        """)
+
+
+def _inject_finanzas_css() -> None:
+    st.markdown(_FIN_CSS, unsafe_allow_html=True)
+
+
+# Card principal (Ventas Totales): plantilla fija, en cada rerun solo se rellenan los montos
+_SUMMARY_TPL = (
+    '<div class="fin-card">'
+    '<div class="fin-label">Ventas Totales</div>'
+    '<div class="fin-big-number">{total_cobrado}</div>'
+    '<div class="fin-mini-grid">'
+    '<div><span class="fin-mini-label">Neto</span><span class="fin-mini-value">{neto_recibido}</span></div>'
+    '<div><span class="fin-mini-label">Unidades</span><span class="fin-mini-value">{unidades}</span></div>'
+    '<div><span class="fin-mini-label">Ganancia</span><span class="fin-mini-value green">{ganancia_neta}</span></div>'
+    '<div><span class="fin-mini-label">Ticket Promedio</span><span class="fin-mini-value">{ticket_promedio}</span></div>'
+    '</div>'
+    '</div>'
+)
 
 
 def _esc(value: object) -> str:
@@ -306,6 +324,19 @@ def _calc_recuperacion_prendas(
     return round(faltante, 2), round(neto_promedio_por_prenda, 2), prendas_faltantes
 
 
+def _as_float(s: pd.Series) -> pd.Series:
+    # Los loaders ya entregan estas columnas como float: solo se re-parsea lo que llegue como texto
+    if pd.api.types.is_numeric_dtype(s):
+        return s.astype(float).fillna(0.0)
+    return pd.to_numeric(s, errors="coerce").fillna(0.0)
+
+
+def _sorted_unique_str(s: pd.Series) -> list[str]:
+    # Se convierte a texto solo cada valor único (no la columna entera) y se ordena con NumPy
+    vals = pd.Series(pd.unique(s.dropna()), dtype=object).astype(str).str.strip()
+    return [v for v in np.unique(vals.to_numpy(dtype=str)).tolist() if v]
+
+
 # --------------------------------------------------
 # Render principal
 # --------------------------------------------------
@@ -319,16 +350,11 @@ def render_finanzas_page(conn, inv_df_full, APP_TZ) -> None:
     inv_df = inv_df_full.copy()
     invst_df = load_inversiones(conn, ttl_s=180)
 
-    if not cab_df.empty:
-        cab_df["_Fecha_dt"] = pd.to_datetime(cab_df["Fecha"], errors="coerce", dayfirst=True)
-    else:
-        cab_df["_Fecha_dt"] = pd.NaT
-
     if not det_df.empty:
-        det_df["Subtotal_Linea"] = pd.to_numeric(det_df["Subtotal_Linea"], errors="coerce").fillna(0.0)
-        det_df["Cantidad"] = pd.to_numeric(det_df["Cantidad"], errors="coerce").fillna(0).astype(int)
-        det_df["Precio_Unitario"] = pd.to_numeric(det_df.get("Precio_Unitario", 0.0), errors="coerce").fillna(0.0)
-        det_df["Descuento_Unitario"] = pd.to_numeric(det_df.get("Descuento_Unitario", 0.0), errors="coerce").fillna(0.0)
+        det_df["Subtotal_Linea"] = _as_float(det_df["Subtotal_Linea"])
+        det_df["Cantidad"] = _as_float(det_df["Cantidad"]).astype(int)
+        det_df["Precio_Unitario"] = _as_float(det_df["Precio_Unitario"])
+        det_df["Descuento_Unitario"] = _as_float(det_df["Descuento_Unitario"])
     else:
         det_df["Subtotal_Linea"] = 0.0
         det_df["Cantidad"] = 0
@@ -342,7 +368,7 @@ def render_finanzas_page(conn, inv_df_full, APP_TZ) -> None:
     )
     if not sku_cost.empty:
         sku_cost["SKU"] = sku_cost["SKU"].astype(str).str.strip()
-        sku_cost["Costo_Unitario"] = pd.to_numeric(sku_cost["Costo_Unitario"], errors="coerce").fillna(0.0)
+        sku_cost["Costo_Unitario"] = _as_float(sku_cost["Costo_Unitario"])
 
     lines = det_df.merge(sku_cost, on="SKU", how="left")
     lines["Costo_Unitario"] = pd.to_numeric(lines.get("Costo_Unitario", 0.0), errors="coerce").fillna(0.0)
@@ -365,7 +391,7 @@ def render_finanzas_page(conn, inv_df_full, APP_TZ) -> None:
     ]
     cab = cab_df[cab_cols].copy()
     for col in ["Total_Cobrado", "Monto_A_Recibir", "Costo_Logistica_Total", "Comision_Monto"]:
-        cab[col] = pd.to_numeric(cab[col], errors="coerce").fillna(0.0)
+        cab[col] = _as_float(cab[col])
 
     lines = lines.merge(sale_line_tot, on="Venta_ID", how="left").merge(cab, on="Venta_ID", how="left")
     lines["_Venta_Subtotal_Lineas"] = pd.to_numeric(lines["_Venta_Subtotal_Lineas"], errors="coerce").fillna(0.0)
@@ -386,11 +412,9 @@ def render_finanzas_page(conn, inv_df_full, APP_TZ) -> None:
     ).round(2)
     lines["_Ganancia_Neta_Linea"] = (lines["_Monto_Asignado"] - lines["COGS_Linea"]).round(2)
 
-    drops_in_data = sorted(
-        [d for d in lines.get("Drop", pd.Series(dtype=str)).dropna().astype(str).str.strip().unique().tolist() if d]
-    )
+    drops_in_data = _sorted_unique_str(lines.get("Drop", pd.Series(dtype=str)))
     if not drops_in_data and not inv_df.empty and "Drop" in inv_df.columns:
-        drops_in_data = sorted([d for d in inv_df["Drop"].dropna().astype(str).str.strip().unique().tolist() if d])
+        drops_in_data = _sorted_unique_str(inv_df["Drop"])
 
     now = datetime.now(APP_TZ)
     this_month = now.strftime("%Y-%m")
@@ -408,6 +432,7 @@ def render_finanzas_page(conn, inv_df_full, APP_TZ) -> None:
     with h2:
         if st.button("🔄 Refrescar", use_container_width=True):
             st.cache_data.clear()
+            clear_prefetch()  # la copia agrupada no vive en st.cache_data
             st.rerun()
 
     sel = st.segmented_control(
@@ -422,9 +447,8 @@ def render_finanzas_page(conn, inv_df_full, APP_TZ) -> None:
         st.rerun()
     sel = sel or st.session_state.fin_filter
 
+    # _Fecha_dt ya viene parseada desde load_cabecera (una vez por carga, no por rerun)
     cab_f = cab_df.copy()
-    if not cab_f.empty:
-        cab_f["_Fecha_dt"] = pd.to_datetime(cab_f["Fecha"], errors="coerce", dayfirst=True)
     if sel == "Este mes" and not cab_f.empty:
         cab_f = cab_f[cab_f["_Fecha_dt"].dt.strftime("%Y-%m") == this_month].copy()
 
@@ -466,30 +490,13 @@ def render_finanzas_page(conn, inv_df_full, APP_TZ) -> None:
 
     # CAMBIO 1: Card principal ahora muestra 4 métricas en grid 2x2
     st.markdown(
-        f"""
-        <div class="fin-card">
-          <div class="fin-label">Ventas Totales</div>
-          <div class="fin-big-number">{money(total_cobrado)}</div>
-          <div class="fin-mini-grid">
-            <div>
-              <span class="fin-mini-label">Neto</span>
-              <span class="fin-mini-value">{money(neto_recibido)}</span>
-            </div>
-            <div>
-              <span class="fin-mini-label">Unidades</span>
-              <span class="fin-mini-value">{unidades}</span>
-            </div>
-            <div>
-              <span class="fin-mini-label">Ganancia</span>
-              <span class="fin-mini-value green">{money(ganancia_neta)}</span>
-            </div>
-            <div>
-              <span class="fin-mini-label">Ticket Promedio</span>
-              <span class="fin-mini-value">{money(ticket_promedio)}</span>
-            </div>
-          </div>
-        </div>
-        """,
+        _SUMMARY_TPL.format_map({
+            "total_cobrado":   money(total_cobrado),
+            "neto_recibido":   money(neto_recibido),
+            "unidades":        unidades,
+            "ganancia_neta":   money(ganancia_neta),
+            "ticket_promedio": money(ticket_promedio),
+        }),
         unsafe_allow_html=True,
     )
 
@@ -579,12 +586,11 @@ def render_finanzas_page(conn, inv_df_full, APP_TZ) -> None:
         star = (
             lines_f.groupby("Producto", as_index=False)["_Ganancia_Neta_Linea"]
             .sum()
-            .sort_values("_Ganancia_Neta_Linea", ascending=False)
-            .head(3)
+            .nlargest(3, "_Ganancia_Neta_Linea")
         )
 
         star_items: list[str] = []
-        for i, (_, r) in enumerate(star.iterrows(), start=1):
+        for i, r in enumerate(star.to_dict("records"), start=1):
             num   = f"{i:02d}"
             name  = _esc(r["Producto"])
             price = money(float(r["_Ganancia_Neta_Linea"]))
@@ -639,12 +645,12 @@ def render_finanzas_page(conn, inv_df_full, APP_TZ) -> None:
         for col in ["Ingreso", "Neto", "COGS", "Ganancia"]:
             g[col] = pd.to_numeric(g[col], errors="coerce").fillna(0.0)
 
-        g["Margen_Pct"] = g.apply(lambda r: (r["Ganancia"] / r["Ingreso"] * 100) if r["Ingreso"] > 0 else 0.0, axis=1)
-        g["ROI_Pct"]    = g.apply(lambda r: (r["Ganancia"] / r["COGS"] * 100) if r["COGS"] > 0 else 0.0, axis=1)
-        g["Pct_Rec"]    = g.apply(
-            lambda r: (r["Neto"] / r["Monto_Invertido"] * 100) if r["Monto_Invertido"] > 0 else -1.0,
-            axis=1,
-        )
+        # Ratios vectorizados: denominador <= 0 -> NaN -> valor por defecto
+        g["Margen_Pct"] = (g["Ganancia"] / g["Ingreso"].where(g["Ingreso"] > 0) * 100).fillna(0.0)
+        g["ROI_Pct"]    = (g["Ganancia"] / g["COGS"].where(g["COGS"] > 0) * 100).fillna(0.0)
+        g["Pct_Rec"]    = (
+            g["Neto"] / g["Monto_Invertido"].where(g["Monto_Invertido"] > 0) * 100
+        ).fillna(-1.0)
         g = g.sort_values(["Pct_Rec", "Neto"], ascending=[False, False])
 
         missing_inv = int((g["Monto_Invertido"] <= 0).sum())
@@ -654,7 +660,7 @@ def render_finanzas_page(conn, inv_df_full, APP_TZ) -> None:
                 unsafe_allow_html=True,
             )
 
-        for _, r in g.iterrows():
+        for r in g.to_dict("records"):
             prod     = str(r["Producto"])
             unids    = int(r["Unidades"])
             ingreso  = float(r["Ingreso"])
@@ -750,14 +756,14 @@ def render_finanzas_page(conn, inv_df_full, APP_TZ) -> None:
             cab_scope = cab_f.copy()
 
         pay = (
-            cab_scope.groupby("Metodo_Pago", as_index=False)["Total_Cobrado"]
+            cab_scope.groupby("Metodo_Pago", as_index=False, observed=True)["Total_Cobrado"]
             .sum()
             .sort_values("Total_Cobrado", ascending=False)
         )
         pay_total = float(pay["Total_Cobrado"].sum())
 
         pay_rows: list[str] = []
-        for _, pm in pay.iterrows():
+        for pm in pay.to_dict("records"):
             metodo  = _esc(pm["Metodo_Pago"])
             monto   = float(pm["Total_Cobrado"])
             pct_bar = (monto / pay_total * 100) if pay_total > 0 else 0.0
@@ -1,25 +1,65 @@
+from copy import deepcopy
 from datetime import datetime
+from functools import lru_cache
 import re
 
-import pandas as pd
+import numpy as np
 import streamlit as st
 
-from modules.core.constants import INV_REQUIRED, SHEET_CATALOGOS, SHEET_INVENTARIO
+from modules.core.constants import BODEGAS, INV_REQUIRED, SHEET_CATALOGOS, SHEET_INVENTARIO, TALLAS_BASE
 from modules.data.helpers import (
+    append_rows_sheet,
+    batch_write_sheets,
+    clear_prefetch,
     ensure_unique_skus,
     get_existing_product_code,
+    inventory_index,
+    inventory_skus,
     load_catalogos,
-    load_inventario,
-    parse_catalogos,
-    save_sheet,
+    load_catalogos_parsed,
     size_sort_key,
     suggest_product_code,
     build_sku,
 )
-
-
-def _inject_inv_css() -> None:
-    st.markdown("""
+from modules.ui.styles import compact_css
+
+
+# Limpieza de códigos para SKUs (compiladas una vez al importar)
+_NON_ALNUM_RE = re.compile(r"[^A-Za-z0-9]")
+# Borrado de espacios por tabla (str.translate) en vez de regex para el código de color
+_WS_DELETE = str.maketrans("", "", " \t\n\r\x0b\x0c\u00a0")
+
+# Estado inicial del formulario de Ingreso (se aplica con un solo recorrido en cada rerun)
+_NP_DEFAULTS = {
+    "np_stage": "define",
+    "np_tiene_tallas": True,
+    "np_tiene_colores": True,
+    "np_nombre": "",
+    "np_drop_sel": "",
+    "np_add_drop": False,
+    "np_new_drop": "",
+    "np_new_drop_code": "",
+    "np_costo": 0.0,
+    "np_precio": 0.0,
+    "np_almacen": "Casa",
+    "np_prod_code": "",
+    "np_allow_stock0": False,
+    "np_colores_sel": ["Standard"],
+    "np_tallas_sel": ["S", "M", "L", "XL"],
+    "np_variants": {"colores": ["Standard"], "tallas": ["OS"]},
+}
+
+
+@lru_cache(maxsize=512)
+def _stk_key(color: str, talla: str) -> str:
+    """Key del number_input de stock por (color, talla); memoizada (se pide en cada rerun del grid)."""
+    c = _NON_ALNUM_RE.sub("", str(color)).upper()[:12] or "STD"
+    t = _NON_ALNUM_RE.sub("", str(talla)).upper()[:6] or "OS"
+    return f"np_stock_{c}_{t}"
+
+
+# CSS de la página compactado una sola vez al importar; cada rerun solo lo re-emite
+_INV_CSS = compact_css("""
     <style>
       :root {
         --inv-bg:       #0e0e0e;
@@ -299,7 +339,11 @@ def _inject_inv_css() -> None:
         margin-bottom: 6px;
       }
     </style>
-    """, unsafe_allow_html=True)
+    """)
+
+
+def _inject_inv_css() -> None:
+    st.markdown(_INV_CSS, unsafe_allow_html=True)
 
 
 def render_inventario_page(conn, inv_df_full, fmt_bodega, bodega1_nombre, bodega2_nombre) -> None:
@@ -339,16 +383,15 @@ def render_inventario_page(conn, inv_df_full, fmt_bodega, bodega1_nombre, bodega
     tab = st.session_state.inv_tab
 
     # ── Datos base ────────────────────────────────────────────────
-    inv_df = inv_df_full.copy()
+    # Solo lectura en toda la página (vistas de inv_df_full, sin copias): las escrituras van a
+    # Sheets y el DataFrame nuevo sale de un concat propio
+    inv_df = inv_df_full
     if "Activo" in inv_df.columns:
-        inv_df = inv_df[inv_df["Activo"].fillna(True) == True].copy()
+        inv_df = inv_df[inv_df["Activo"].fillna(True) == True]
 
-    cat_df = load_catalogos(conn, ttl_s=600)
-    cat = parse_catalogos(cat_df)
-    colores_cat = cat.get("colores", [])
-    color_to_code = {c["valor"]: c["codigo"] for c in colores_cat}
-    color_to_code.setdefault("Standard", "STD")
-    color_to_code.setdefault("STANDARD", "STD")
+    cat = load_catalogos_parsed(conn, ttl_s=600)
+    casa_name = fmt_bodega("Casa")
+    bod_name = fmt_bodega("Bodega")
 
     # ══════════════════════════════════════════════════════════════
     # TAB: INVENTARIO
@@ -360,17 +403,23 @@ def render_inventario_page(conn, inv_df_full, fmt_bodega, bodega1_nombre, bodega
         with c_btn:
             if st.button("🔄 Refrescar", use_container_width=True):
                 st.cache_data.clear()
+                clear_prefetch()  # la copia agrupada no vive en st.cache_data
                 st.rerun()
 
         if inv_df.empty:
             st.info("No hay filas en Inventario todavía.")
         else:
-            productos = sorted(inv_df["Producto"].dropna().astype(str).unique().tolist())
-            for producto in productos:
-                p_df = inv_df[inv_df["Producto"] == producto].copy()
-
-                casa_total = int(p_df.get("Stock_Casa", 0).fillna(0).sum())
-                bod_total = int(p_df.get("Stock_Bodega", 0).fillna(0).sum())
+            # Filas y totales de cada producto desde el índice cacheado (un solo groupby, sin
+            # una máscara + copia + sumas por producto)
+            inv_idx = inventory_index(inv_df)
+            # Color/Talla normalizados una sola vez para todo el inventario (no dentro de cada expander)
+            color_norm = inv_df["Color"].astype(object).fillna("Standard").astype(str).str.strip()
+            talla_norm = inv_df["Talla"].astype(object).fillna("OS").astype(str).str.strip()
+            talla_upper = talla_norm.str.upper()
+            for producto in inv_idx["productos"]:
+                p_df = inv_df.loc[inv_idx["rows"][producto]]
+
+                casa_total, bod_total = inv_idx["totals"][producto]
                 total = casa_total + bod_total
 
                 with st.expander(f"**{producto}** — Stock Total: {total}", expanded=False):
@@ -382,10 +431,7 @@ def render_inventario_page(conn, inv_df_full, fmt_bodega, bodega1_nombre, bodega
                         unsafe_allow_html=True,
                     )
 
-                    colors = (
-                        p_df.get("Color", pd.Series([], dtype=str))
-                        .fillna("Standard").astype(str).str.strip().unique().tolist()
-                    )
+                    colors = color_norm.loc[p_df.index].unique().tolist()
                     colors = [c for c in colors if c and c.lower() != "nan"]
                     has_real_colors = any(c.lower() != "standard" for c in colors)
 
@@ -400,22 +446,17 @@ def render_inventario_page(conn, inv_df_full, fmt_bodega, bodega1_nombre, bodega
                             label_visibility="collapsed",
                             key=f"inv_color_{producto}",
                         )
-                        show_df = p_df[
-                            p_df["Color"].fillna("Standard").astype(str).str.strip() == selected_color
-                        ].copy()
+                        show_df = p_df[color_norm.loc[p_df.index] == selected_color]
 
-                    sizes = (
-                        show_df.get("Talla", pd.Series([], dtype=str))
-                        .fillna("OS").astype(str).str.strip().unique().tolist()
-                    )
+                    sizes = talla_norm.loc[show_df.index].unique().tolist()
                     sizes = [s for s in sizes if s and s.lower() != "nan"]
                     has_sizes = not (len(sizes) == 1 and sizes[0].upper() == "OS")
 
                     st.markdown('<div class="inv-section-title">Stock por talla:</div>', unsafe_allow_html=True)
 
                     if not has_sizes:
-                        casa = int(show_df.get("Stock_Casa", 0).fillna(0).sum())
-                        bod = int(show_df.get("Stock_Bodega", 0).fillna(0).sum())
+                        casa = int(show_df["Stock_Casa"].sum())
+                        bod = int(show_df["Stock_Bodega"].sum())
                         mx = max(casa, bod, 1)
                         st.markdown('<div class="inv-talla-title">Talla OS</div>', unsafe_allow_html=True)
                         c1, c2 = st.columns(2)
@@ -434,13 +475,19 @@ def render_inventario_page(conn, inv_df_full, fmt_bodega, bodega1_nombre, bodega
                                 unsafe_allow_html=True,
                             )
                     else:
+                        # Stock por talla en un solo groupby (no un filtro + dos sumas por talla)
+                        por_talla = (
+                            show_df[["Stock_Casa", "Stock_Bodega"]]
+                            .groupby(talla_upper.loc[show_df.index], sort=False)
+                            .sum()
+                        )
+                        stock_talla = {
+                            t: (int(c), int(b))
+                            for t, c, b in zip(por_talla.index, por_talla["Stock_Casa"], por_talla["Stock_Bodega"])
+                        }
                         sizes_sorted = sorted(sizes, key=size_sort_key)
                         for talla in sizes_sorted:
-                            row = show_df[
-                                show_df["Talla"].fillna("OS").astype(str).str.strip().str.upper() == str(talla).upper()
-                            ]
-                            casa = int(row.get("Stock_Casa", 0).fillna(0).sum())
-                            bod = int(row.get("Stock_Bodega", 0).fillna(0).sum())
+                            casa, bod = stock_talla.get(str(talla).upper(), (0, 0))
                             mx = max(casa, bod, 1)
 
                             st.markdown(f'<div class="inv-talla-title">Talla {talla}</div>', unsafe_allow_html=True)
@@ -467,28 +514,33 @@ def render_inventario_page(conn, inv_df_full, fmt_bodega, bodega1_nombre, bodega
         st.markdown('<div class="inv-page-title upper">Transferir Stock</div>', unsafe_allow_html=True)
         st.markdown('<div class="inv-page-sub">Gestiona transferencias internas entre almacenes</div>', unsafe_allow_html=True)
 
-        inv_latest = load_inventario(conn, ttl_s=45)
-        if "Activo" in inv_latest.columns:
-            inv_latest = inv_latest[inv_latest["Activo"].fillna(True) == True].copy()
+        # Mismo inventario (activo) que ya cargó app.py en este rerun: sin otra lectura/copia del cache
+        inv_latest = inv_df
 
         if inv_latest.empty:
             st.warning("No hay SKUs en Inventario.")
         else:
-            inv_latest["__label"] = (
-                inv_latest["Producto"].astype(str)
-                + " - "
-                + inv_latest["Color"].fillna("Standard").astype(str)
-                + " - "
-                + inv_latest["Talla"].fillna("OS").astype(str)
+            # Etiqueta "Producto - Color - Talla" en un solo str.cat; no se agrega como columna para que
+            # inventory_index reciba el mismo DataFrame que en la pestaña Inventario (mismo cache)
+            labels = inv_latest["Producto"].astype(str).str.cat(
+                [
+                    inv_latest["Color"].astype(object).fillna("Standard").astype(str),
+                    inv_latest["Talla"].astype(object).fillna("OS").astype(str),
+                ],
+                sep=" - ",
             )
 
+            # El selectbox guarda el SKU y muestra la etiqueta; la fila sale del índice SKU -> label (sin filtrar)
+            inv_idx = inventory_index(inv_latest)
+            sku_to_ix = inv_idx["by_sku"]
+            sku_to_label = dict(zip(inv_latest["SKU"], labels))
+
             st.markdown('<span class="inv-tr-label">Producto Seleccionado (SKU)</span>', unsafe_allow_html=True)
-            sku_options = inv_latest["__label"].tolist()
-            label_sel = st.selectbox("SKU", sku_options, key="transfer_sku_label", label_visibility="collapsed")
+            sku = st.selectbox("SKU", list(sku_to_ix), format_func=sku_to_label.__getitem__,
+                               key="transfer_sku", label_visibility="collapsed")
 
-            sel_row = inv_latest[inv_latest["__label"] == label_sel].iloc[0]
-            sku = str(sel_row["SKU"])
-            sku_label = str(sel_row["__label"])
+            sel_ix = sku_to_ix[sku]
+            sku_label = sku_to_label[sku]
 
             st.markdown(
                 f'<div class="inv-tr-sku-box">'
@@ -498,14 +550,13 @@ def render_inventario_page(conn, inv_df_full, fmt_bodega, bodega1_nombre, bodega
                 unsafe_allow_html=True,
             )
 
-            casa_stock = int(sel_row.get("Stock_Casa", 0) or 0)
-            bod_stock = int(sel_row.get("Stock_Bodega", 0) or 0)
+            casa_stock, bod_stock = inv_idx["items"][sel_ix][3:]
 
             if "transfer_dir" not in st.session_state:
-                st.session_state.transfer_dir = f"{fmt_bodega('Casa')} ➜ {fmt_bodega('Bodega')}"
+                st.session_state.transfer_dir = f"{casa_name} ➜ {bod_name}"
 
-            dir_opt1 = f"{fmt_bodega('Casa')} ➜ {fmt_bodega('Bodega')}"
-            dir_opt2 = f"{fmt_bodega('Bodega')} ➜ {fmt_bodega('Casa')}"
+            dir_opt1 = f"{casa_name} ➜ {bod_name}"
+            dir_opt2 = f"{bod_name} ➜ {casa_name}"
             direction = st.session_state.transfer_dir
 
             is_casa_to_bod = direction == dir_opt1
@@ -572,41 +623,29 @@ def render_inventario_page(conn, inv_df_full, fmt_bodega, bodega1_nombre, bodega
             )
             st.caption("El stock se actualizará instantáneamente tras la confirmación.")
 
-            def _can_move() -> tuple[bool, str]:
-                if is_casa_to_bod:
-                    if qty > casa_stock:
-                        return False, f"No hay suficiente stock en {bodega1_nombre}."
-                else:
-                    if qty > bod_stock:
-                        return False, f"No hay suficiente stock en {bodega2_nombre}."
-                return True, ""
-
-            ok, msg = _can_move()
+            ok = qty <= orig_stock
             if not ok:
-                st.error(msg)
+                st.error(f"No hay suficiente stock en {orig_name}.")
 
             if st.button("⇄  TRANSFERIR STOCK", use_container_width=True, disabled=not ok, type="primary"):
-                st.cache_data.clear()
-                inv_fresh = load_inventario(conn, ttl_s=45)
-                if "Activo" in inv_fresh.columns:
-                    inv_fresh = inv_fresh[inv_fresh["Activo"].fillna(True) == True].copy()
+                # Delta sobre el stock ACTUAL de las 2 celdas del SKU (se lee y valida dentro del commit).
+                delta_casa = -int(qty) if is_casa_to_bod else int(qty)
 
-                idx = inv_fresh.index[inv_fresh["SKU"].astype(str) == sku]
-                if idx.empty:
-                    st.error("SKU no encontrado. Refrescá e intentá otra vez.")
+                try:
+                    batch_write_sheets(
+                        conn,
+                        appends=[],
+                        cell_updates=[],
+                        cell_deltas=[
+                            (SHEET_INVENTARIO, "SKU", sku, "Stock_Casa", delta_casa),
+                            (SHEET_INVENTARIO, "SKU", sku, "Stock_Bodega", -delta_casa),
+                        ],
+                    )
+                except ValueError as e:
+                    st.error(f"No se pudo transferir: {e} Refrescá e intentá otra vez.")
                     st.stop()
 
-                i0 = idx[0]
-                if is_casa_to_bod:
-                    inv_fresh.at[i0, "Stock_Casa"] = int(inv_fresh.at[i0, "Stock_Casa"] or 0) - int(qty)
-                    inv_fresh.at[i0, "Stock_Bodega"] = int(inv_fresh.at[i0, "Stock_Bodega"] or 0) + int(qty)
-                else:
-                    inv_fresh.at[i0, "Stock_Bodega"] = int(inv_fresh.at[i0, "Stock_Bodega"] or 0) - int(qty)
-                    inv_fresh.at[i0, "Stock_Casa"] = int(inv_fresh.at[i0, "Stock_Casa"] or 0) + int(qty)
-
-                save_sheet(conn, SHEET_INVENTARIO, inv_fresh)
                 st.success("✅ Transferencia realizada.")
-                st.cache_data.clear()
                 st.rerun()
 
     # ══════════════════════════════════════════════════════════════
@@ -621,22 +660,10 @@ def render_inventario_page(conn, inv_df_full, fmt_bodega, bodega1_nombre, bodega
 
         def _np_init_state() -> None:
             ss = st.session_state
-            ss.setdefault("np_stage", "define")
-            ss.setdefault("np_tiene_tallas", True)
-            ss.setdefault("np_tiene_colores", True)
-            ss.setdefault("np_nombre", "")
-            ss.setdefault("np_drop_sel", "")
-            ss.setdefault("np_add_drop", False)
-            ss.setdefault("np_new_drop", "")
-            ss.setdefault("np_new_drop_code", "")
-            ss.setdefault("np_costo", 0.0)
-            ss.setdefault("np_precio", 0.0)
-            ss.setdefault("np_almacen", "Casa")
-            ss.setdefault("np_prod_code", "")
-            ss.setdefault("np_allow_stock0", False)
-            ss.setdefault("np_colores_sel", ["Standard"])
-            ss.setdefault("np_tallas_sel", ["S", "M", "L", "XL"])
-            ss.setdefault("np_variants", {"colores": ["Standard"], "tallas": ["OS"]})
+            for k, v in _NP_DEFAULTS.items():
+                if k not in ss:
+                    # Copia de listas/dicts: el default del módulo no se comparte entre sesiones
+                    ss[k] = deepcopy(v)
 
         def _np_clear_stock_keys() -> None:
             kill = [k for k in st.session_state.keys() if str(k).startswith("np_stock_")]
@@ -662,21 +689,17 @@ def render_inventario_page(conn, inv_df_full, fmt_bodega, bodega1_nombre, bodega
             _np_clear_stock_keys()
 
         def _np_reset_all() -> None:
-            keys = [
-                "np_stage", "np_tiene_tallas", "np_tiene_colores", "np_nombre",
-                "np_drop_sel", "np_add_drop", "np_new_drop", "np_new_drop_code",
-                "np_costo", "np_precio", "np_almacen", "np_prod_code",
-                "np_allow_stock0", "np_colores_sel", "np_tallas_sel", "np_variants",
-            ]
-            for k in keys:
+            for k in _NP_DEFAULTS:
                 if k in st.session_state:
                     del st.session_state[k]
             _np_clear_stock_keys()
             _np_init_state()
 
         _np_init_state()
+        # Tras _np_init_state todas las claves np_* existen: lecturas directas, sin .get(...)
+        ss = st.session_state
 
-        stage = str(st.session_state.get("np_stage", "define"))
+        stage = str(ss["np_stage"])
         locked = stage == "stock"
 
         drops = cat.get("drops", [])
@@ -688,11 +711,11 @@ def render_inventario_page(conn, inv_df_full, fmt_bodega, bodega1_nombre, bodega
         color_to_code2.setdefault("Standard", "STD")
         color_to_code2.setdefault("STANDARD", "STD")
 
-        if st.session_state.get("np_drop_sel") not in drop_vals:
-            st.session_state["np_drop_sel"] = drop_vals[0]
+        if ss["np_drop_sel"] not in drop_vals:
+            ss["np_drop_sel"] = drop_vals[0]
 
-        if not str(st.session_state.get("np_prod_code", "")).strip() and str(st.session_state.get("np_nombre", "")).strip():
-            st.session_state["np_prod_code"] = suggest_product_code(str(st.session_state.get("np_nombre", "")))
+        if not str(ss["np_prod_code"]).strip() and str(ss["np_nombre"]).strip():
+            ss["np_prod_code"] = suggest_product_code(str(ss["np_nombre"]))
 
         sw1, sw2 = st.columns(2)
         with sw1:
@@ -722,7 +745,7 @@ def render_inventario_page(conn, inv_df_full, fmt_bodega, bodega1_nombre, bodega
 
         with st.expander("Agregar drop nuevo (opcional)", expanded=False):
             st.checkbox("Agregar drop nuevo", key="np_add_drop", disabled=locked)
-            if st.session_state.get("np_add_drop", False):
+            if ss["np_add_drop"]:
                 st.text_input("Nuevo drop (ej: D005)", key="np_new_drop", disabled=locked)
                 st.text_input("Código drop", key="np_new_drop_code", disabled=locked)
 
@@ -755,7 +778,7 @@ def render_inventario_page(conn, inv_df_full, fmt_bodega, bodega1_nombre, bodega
         st.markdown('<div class="inv-ing-section-title">Almacén Inicial</div>', unsafe_allow_html=True)
         st.radio(
             "Almacén",
-            options=["Casa", "Bodega"],
+            options=BODEGAS,
             horizontal=True,
             key="np_almacen",
             format_func=fmt_bodega,
@@ -776,23 +799,23 @@ def render_inventario_page(conn, inv_df_full, fmt_bodega, bodega1_nombre, bodega
 
         st.toggle("Permitir guardar con stock 0", key="np_allow_stock0", disabled=locked)
 
-        tiene_tallas = bool(st.session_state.get("np_tiene_tallas", True))
-        tiene_colores = bool(st.session_state.get("np_tiene_colores", True))
+        tiene_tallas = bool(ss["np_tiene_tallas"])
+        tiene_colores = bool(ss["np_tiene_colores"])
 
         if not locked:
             if tiene_tallas:
-                st.multiselect("Tallas", options=["XS", "S", "M", "L", "XL", "XXL", "XXXL", "OS"], key="np_tallas_sel")
+                st.multiselect("Tallas", options=TALLAS_BASE, key="np_tallas_sel")
             else:
-                st.session_state["np_tallas_sel"] = ["OS"]
+                ss["np_tallas_sel"] = ["OS"]
 
             if tiene_colores:
                 if not color_vals:
                     st.info("No hay colores en Catalogos. Se usará 'Standard'.")
-                    st.session_state["np_colores_sel"] = ["Standard"]
+                    ss["np_colores_sel"] = ["Standard"]
                 else:
                     st.multiselect("Colores", options=color_vals, key="np_colores_sel")
             else:
-                st.session_state["np_colores_sel"] = ["Standard"]
+                ss["np_colores_sel"] = ["Standard"]
 
             b1, b2 = st.columns(2)
             with b1:
@@ -805,7 +828,7 @@ def render_inventario_page(conn, inv_df_full, fmt_bodega, bodega1_nombre, bodega
                     st.rerun()
 
         if locked:
-            v = st.session_state.get("np_variants", {}) or {}
+            v = ss["np_variants"] or {}
             v_colors = [str(x) for x in (v.get("colores") or ["Standard"]) if str(x).strip()]
             v_sizes = [str(x).upper() for x in (v.get("tallas") or ["OS"]) if str(x).strip()]
 
@@ -825,40 +848,31 @@ def render_inventario_page(conn, inv_df_full, fmt_bodega, bodega1_nombre, bodega
 
             st.markdown("### Stock inicial (unidades)")
 
-            total_units = 0
-            stock_map: dict[tuple[str, str], int] = {}
-
-            def _stk_key(color: str, talla: str) -> str:
-                c = re.sub(r"[^A-Za-z0-9]", "", str(color)).upper()[:12] or "STD"
-                t = re.sub(r"[^A-Za-z0-9]", "", str(talla)).upper()[:6] or "OS"
-                return f"np_stock_{c}_{t}"
+            # Grilla colores × tallas en un array: subtotales y total salen de reducciones de NumPy
+            stock_arr = np.zeros((len(v_colors), len(v_sizes)), dtype=np.int64)
 
-            for color in v_colors:
+            for i, color in enumerate(v_colors):
                 st.markdown(f"**Color:** {color}")
                 cols = st.columns(len(v_sizes)) if len(v_sizes) <= 5 else None
-                row_vals = []
                 for j, talla in enumerate(v_sizes):
                     key = _stk_key(color, talla)
                     if cols is None:
-                        val = int(st.number_input(f"{talla}", min_value=0, step=1, value=0, key=key))
+                        stock_arr[i, j] = st.number_input(f"{talla}", min_value=0, step=1, value=0, key=key)
                     else:
                         with cols[j]:
-                            val = int(st.number_input(f"{talla}", min_value=0, step=1, value=0, key=key))
-                    stock_map[(color, talla)] = val
-                    row_vals.append(val)
-                subtotal = int(sum(row_vals))
-                total_units += subtotal
-                st.caption(f"Total {color}: {subtotal} u.")
+                            stock_arr[i, j] = st.number_input(f"{talla}", min_value=0, step=1, value=0, key=key)
+                st.caption(f"Total {color}: {int(stock_arr[i].sum())} u.")
 
-            st.caption(f"**Total de unidades:** {int(total_units)}")
+            total_units = int(stock_arr.sum())
+            st.caption(f"**Total de unidades:** {total_units}")
 
             can_save = True
             errors: list[str] = []
-            nombre = str(st.session_state.get("np_nombre", "")).strip()
+            nombre = str(ss["np_nombre"]).strip()
             if not nombre:
                 can_save = False
                 errors.append("Escribí el Nombre del producto.")
-            if not st.session_state.get("np_allow_stock0", False) and int(total_units) <= 0:
+            if not ss["np_allow_stock0"] and total_units <= 0:
                 can_save = False
                 errors.append("El stock total es 0 (activá 'Permitir guardar con stock 0' si querés igual).")
             if errors:
@@ -866,10 +880,11 @@ def render_inventario_page(conn, inv_df_full, fmt_bodega, bodega1_nombre, bodega
 
             if st.button("💾 Guardar producto", use_container_width=True, disabled=not can_save, type="primary"):
                 try:
-                    if bool(st.session_state.get("np_add_drop", False)) and str(st.session_state.get("np_new_drop", "")).strip():
-                        nd = str(st.session_state.get("np_new_drop", "")).strip().upper()
-                        nd_code = str(st.session_state.get("np_new_drop_code", "")).strip().upper() or nd
-                        cat_write = load_catalogos(conn, ttl_s=600).copy()
+                    if bool(ss["np_add_drop"]) and str(ss["np_new_drop"]).strip():
+                        nd = str(ss["np_new_drop"]).strip().upper()
+                        nd_code = str(ss["np_new_drop_code"]).strip().upper() or nd
+                        # st.cache_data ya entrega una copia propia: se puede modificar sin otra copia
+                        cat_write = load_catalogos(conn, ttl_s=600)
                         cat_write.columns = [str(c).strip() for c in cat_write.columns]
                         if "Catalogo" in cat_write.columns:
                             cat_write["Catalogo"] = cat_write["Catalogo"].ffill()
@@ -878,13 +893,15 @@ def render_inventario_page(conn, inv_df_full, fmt_bodega, bodega1_nombre, bodega
                             & (cat_write.get("Valor", "").astype(str).str.upper() == nd)
                         )
                         if not already.any():
-                            cat_write = pd.concat(
-                                [cat_write, pd.DataFrame([{"Catalogo": "DROP", "Valor": nd, "Codigo": nd_code}])],
-                                ignore_index=True,
+                            # Solo la fila nueva (append): sin concat ni reescribir toda la hoja
+                            append_rows_sheet(
+                                conn,
+                                SHEET_CATALOGOS,
+                                [{"Catalogo": "DROP", "Valor": nd, "Codigo": nd_code}],
+                                ["Catalogo", "Valor", "Codigo"],
                             )
-                            save_sheet(conn, SHEET_CATALOGOS, cat_write)
 
-                    drop_sel = str(st.session_state.get("np_drop_sel", "")).strip()
+                    drop_sel = str(ss["np_drop_sel"]).strip()
                     drop_code = next(
                         (str(d.get("codigo", "")).strip() for d in drops if str(d.get("valor", "")).strip() == drop_sel),
                         None,
@@ -892,30 +909,30 @@ def render_inventario_page(conn, inv_df_full, fmt_bodega, bodega1_nombre, bodega
                     if not drop_code or str(drop_code).lower() == "nan":
                         drop_code = drop_sel.strip().upper()
 
-                    raw_pc = re.sub(r"[^A-Za-z0-9]", "", str(st.session_state.get("np_prod_code", "")).strip()).upper()[:3] or "PRD"
+                    raw_pc = _NON_ALNUM_RE.sub("", str(ss["np_prod_code"]).strip()).upper()[:3] or "PRD"
                     prod_code = (raw_pc + "XXX")[:3]
 
-                    costo = float(st.session_state.get("np_costo", 0.0) or 0.0)
-                    precio = float(st.session_state.get("np_precio", 0.0) or 0.0)
-                    almacen = str(st.session_state.get("np_almacen", "Casa"))
+                    costo = float(ss["np_costo"] or 0.0)
+                    precio = float(ss["np_precio"] or 0.0)
+                    almacen = str(ss["np_almacen"])
 
                     existing_code = get_existing_product_code(inv_df, nombre)
                     if existing_code:
                         prod_code = str(existing_code).strip().upper()[:3]
 
-                    inv_now = load_inventario(conn, ttl_s=45).copy()
-                    existing_skus = set(inv_now["SKU"].astype(str).str.strip().tolist())
+                    # SKUs del inventario completo (incluye inactivos), normalizados una vez por carga
+                    existing_skus = inventory_skus(inv_df_full)
 
                     rows = []
-                    for col in v_colors:
+                    for i, col in enumerate(v_colors):
                         col_label = str(col).strip() if tiene_colores else "Standard"
                         col_code = color_to_code2.get(col_label) or color_to_code2.get(col_label.title())
                         if not col_code:
-                            col_code = re.sub(r"\s+", "", col_label).upper()[:3] or "STD"
-                        for talla in v_sizes:
+                            col_code = col_label.translate(_WS_DELETE).upper()[:3] or "STD"
+                        for j, talla in enumerate(v_sizes):
                             talla_label = str(talla).strip().upper() if tiene_tallas else "OS"
                             sku_new = build_sku(drop_code, prod_code, col_code, talla_label)
-                            qty = int(stock_map.get((col, talla), 0) or 0)
+                            qty = int(stock_arr[i, j])
                             rows.append({
                                 "SKU": sku_new,
                                 "Drop": drop_code,
@@ -934,15 +951,10 @@ def render_inventario_page(conn, inv_df_full, fmt_bodega, bodega1_nombre, bodega
                         st.error("SKUs duplicados: " + ", ".join(dups))
                         st.stop()
 
-                    inv_out = inv_now.copy()
-                    for col in INV_REQUIRED:
-                        if col not in inv_out.columns:
-                            inv_out[col] = None
-                    inv_out = pd.concat([inv_out, pd.DataFrame(rows)], ignore_index=True)
-                    save_sheet(conn, SHEET_INVENTARIO, inv_out)
+                    # Solo las filas nuevas al final de Inventario (append): no se reescribe la hoja entera
+                    append_rows_sheet(conn, SHEET_INVENTARIO, rows, INV_REQUIRED)
 
                     st.success(f"✅ Producto creado: {nombre} ({len(rows)} SKU(s))")
-                    st.cache_data.clear()
                     _np_reset_all()
                     st.rerun()
 
@@ -7,8 +7,9 @@ def init_navigation_state() -> None:
 
 
 def _scheletro_set_page(p: str) -> None:
+    # Callback (on_click): corre antes del rerun del click, así ese mismo rerun ya pinta la página
+    # nueva; con st.rerun() dentro del if se pintaba la página vieja completa y luego otra vez.
     st.session_state.scheletro_page = p
-    st.rerun()
 
 
 def render_bottom_nav(page: str) -> None:
@@ -22,8 +23,8 @@ def render_bottom_nav(page: str) -> None:
             with col:
                 marker_cls = "scheletro-nav-state active" if active else "scheletro-nav-state"
                 st.markdown(f'<div class="{marker_cls}"></div>', unsafe_allow_html=True)
-                if st.button(ico, key=f"nav_{target}", use_container_width=True, help=label):
-                    _scheletro_set_page(target)
+                st.button(ico, key=f"nav_{target}", use_container_width=True, help=label,
+                          on_click=_scheletro_set_page, args=(target,))
 
         _nav_btn(c1, "Dashboard", "📊", "Dashboard")
         _nav_btn(c2, "Inventario", "📦", "Inventario")
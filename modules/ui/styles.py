@@ -1,4 +1,5 @@
 from contextlib import contextmanager
+import re
 
 import streamlit as st
 
@@ -7,14 +8,25 @@ import streamlit as st
 # UI helpers (tu estilo card)
 # -----------------------------
 def money(x: float) -> str:
+    # Camino directo para float/int (numpy float64 es subclase de float); el resto pasa por float()
+    if isinstance(x, (float, int)):
+        return f"${x:,.2f}"
     try:
         return f"${float(x):,.2f}"
-    except Exception:
+    except (TypeError, ValueError):
         return "$0.00"
 
 
+def money_fast(x: float) -> str:
+    """money() sin float()/try: solo para valores que ya son float (resultados de cálculos)."""
+    return f"${x:,.2f}"
+
+
+_LEADING_WS_RE = re.compile(r"(?m)^[ \t]+")
+
+
 def normalize_html(html: str) -> str:
-    return "\n".join(line.lstrip() for line in html.splitlines()).strip()
+    return _LEADING_WS_RE.sub("", html).strip()
 
 
 @contextmanager
@@ -24,9 +36,10 @@ def card():
         yield
 
 
-def inject_css() -> None:
-    st.markdown(
-        """
+# CSS global como constante de módulo: se arma y compacta una sola vez al importar.
+# Se sigue emitiendo en cada rerun (Streamlit elimina los elementos que un rerun no vuelve a
+# dibujar), pero sin la indentación ni líneas vacías el payload por rerun es bastante menor.
+_CSS_SOURCE = """
         <style>
           .block-container {
               padding-top: 0.6rem;
@@ -650,6 +663,15 @@ def inject_css() -> None:
               }
           }
         </style>
-        """,
-        unsafe_allow_html=True,
-    )
+        """
+
+def compact_css(src: str) -> str:
+    """Quita la indentación y las líneas vacías de un bloque <style> (se llama una vez, al importar)."""
+    return "\n".join(line.strip() for line in src.splitlines() if line.strip())
+
+
+_CSS = compact_css(_CSS_SOURCE)
+
+
+def inject_css() -> None:
+    st.markdown(_CSS, unsafe_allow_html=True)
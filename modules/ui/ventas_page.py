@@ -3,35 +3,59 @@ from __future__ import annotations
 from datetime import datetime
 from typing import Any, cast
 import re
+import time
 
 import pandas as pd
 import streamlit as st
 
-from modules.core.constants import (
-    CAB_REQUIRED, DET_REQUIRED, EG_REQUIRED,
-    SHEET_CATEGORIAS, SHEET_EGRESOS, SHEET_INVENTARIO,
-    SHEET_VENTAS_CAB, SHEET_VENTAS_DET,
-)
+from modules.core.constants import CAT_REQUIRED, EG_REQUIRED, METODOS_PAGO, SHEET_CATEGORIAS, SHEET_EGRESOS
 from modules.data.helpers import (
+    DuplicateKeyError,
     _align_required_columns,
-    _clean_number,
     _next_egreso_id,
+    append_rows_sheet,
     comision_porcentaje,
+    commit_sale,
+    inventory_index,
     load_cabecera,
-    load_catalogos,
+    load_catalogos_parsed,
     load_categorias,
-    load_detalle,
     load_egresos,
-    load_inventario,
     next_venta_id,
-    parse_catalogos,
-    save_sheet,
 )
-from modules.ui.styles import money, normalize_html
+from modules.ui.styles import compact_css, money, money_fast, normalize_html
+
+
+# Códigos de drop tipo D001 (para mostrarlos como "DROP 01")
+_DROP_CODE_RE = re.compile(r"^D(\d{3})$")
+
+# Opciones del radio de comisión Contra Entrega
+_PCE_MODOS = ("2.99%", "Otro")
+
+# Ventana (s) en la que un segundo envío idéntico se considera doble-click
+_SALE_DEBOUNCE_S = 10.0
+
+# Plantilla del Resumen Económico: se arma una sola vez al importar y en cada rerun solo se rellena
+_RESUMEN_TPL = (
+    '<div class="v-resumen-card">'
+    '<div class="v-resumen-title">Resumen Económico</div>'
+    '<div class="v-resumen-row"><span class="v-resumen-label">Subtotal productos</span><span class="v-resumen-value">{total_lineas}</span></div>'
+    '<div class="v-resumen-row"><span class="v-resumen-label">Envío cobrado</span><span class="v-resumen-value">{envio_cliente}</span></div>'
+    '<div class="v-resumen-divider"></div>'
+    '<div class="v-resumen-row"><span class="v-resumen-total-label">Total cobrado</span><span class="v-resumen-total-val">{total_cobrado}</span></div>'
+    '<div class="v-resumen-divider"></div>'
+    '<div class="v-resumen-row"><span class="v-resumen-label">Costo courier</span><span class="v-resumen-value v-resumen-red">-{costo_courier}</span></div>'
+    '<div class="v-resumen-row"><span class="v-resumen-label">Comisión ({com_porc:.2f}%)</span><span class="v-resumen-value v-resumen-red">-{com_monto}</span></div>'
+    '<div class="v-monto-box">'
+    '<span class="v-monto-label">Monto a recibir</span>'
+    '<span class="v-monto-value {monto_class}">{monto_a_recibir}</span>'
+    '</div>'
+    '</div>'
+)
 
 
-def _inject_ventas_css() -> None:
-    st.markdown("""
+# CSS de la página compactado una sola vez al importar; cada rerun solo lo re-emite
+_VENTAS_CSS = compact_css("""
     <style>
       :root {
         --v-bg:       #000000;
@@ -305,7 +329,184 @@ def _inject_ventas_css() -> None:
       .eg-tx-meta    { font-size: 0.7rem; color: var(--v-muted); margin-top: 2px; }
       .eg-tx-amount  { font-size: 0.88rem; font-weight: 600; color: var(--v-danger); white-space: nowrap; margin-left: 14px; }
     </style>
-    """, unsafe_allow_html=True)
+    """)
+
+
+def _inject_ventas_css() -> None:
+    st.markdown(_VENTAS_CSS, unsafe_allow_html=True)
+
+
+@st.fragment
+def _render_checkout(conn, cfg, APP_TZ, fmt_bodega) -> None:
+    """Datos de venta, Resumen y registro como fragmento.
+
+    Cambiar método/envío/courier/PCE solo re-ejecuta esta sección (no el selector ni el
+    carrito); el st.rerun() tras registrar sigue recargando la página completa.
+    """
+    cart = cast(list[dict[str, Any]], st.session_state["cart"])
+
+    # ── 4. Datos de venta ──────────────────────────────────────
+    st.markdown('<div class="v-section-title" style="margin-top:20px">Datos de venta</div>', unsafe_allow_html=True)
+
+    st.markdown('<span class="v-label">Método de pago</span>', unsafe_allow_html=True)
+    metodo_pago = st.selectbox(
+        "Método de pago",
+        options=METODOS_PAGO,
+        key="metodo_pago", label_visibility="collapsed",
+    )
+
+    cc1, cc2 = st.columns(2)
+    with cc1:
+        st.markdown('<span class="v-label">Envío cobrado ($)</span>', unsafe_allow_html=True)
+        envio_cliente = st.number_input("Envío", min_value=0.0, step=0.50, format="%.2f",
+                                        key="envio_cliente", label_visibility="collapsed")
+    with cc2:
+        st.markdown('<span class="v-label">Costo real courier ($)</span>', unsafe_allow_html=True)
+        costo_courier = st.number_input("Courier", min_value=0.0, step=0.50, format="%.2f",
+                                        key="costo_courier", label_visibility="collapsed")
+
+    override_pce: float | None = None
+    if metodo_pago == "Contra Entrega":
+        st.markdown("**Comisión PCE (Contra Entrega)**")
+        pce_mode = st.radio("Comisión", _PCE_MODOS, horizontal=True, key="pce_mode")
+        if pce_mode == "Otro":
+            p_val = st.number_input("Porcentaje PCE (%)", min_value=0.0, step=0.10,
+                                    format="%.2f", key="pce_otro")
+            override_pce = float(p_val) / 100.0
+
+
+    # ── 5. Resumen ────────────────────────────────────────────
+    total_lineas    = round(sum(float(x["Subtotal_Linea"]) for x in cart), 2) if cart else 0.0
+    total_cobrado   = round(total_lineas + float(envio_cliente), 2)
+    com_porc        = comision_porcentaje(metodo_pago, cfg, override_pce)
+    com_monto       = round(total_cobrado * float(com_porc), 2)
+    monto_a_recibir = round(total_cobrado - float(costo_courier) - com_monto, 2)
+    monto_class     = "" if monto_a_recibir >= 0 else "red"
+
+    st.markdown(
+        _RESUMEN_TPL.format_map({
+            "total_lineas":    money_fast(total_lineas),
+            "envio_cliente":   money_fast(envio_cliente),
+            "total_cobrado":   money_fast(total_cobrado),
+            "costo_courier":   money_fast(costo_courier),
+            "com_porc":        com_porc * 100,
+            "com_monto":       money_fast(com_monto),
+            "monto_class":     monto_class,
+            "monto_a_recibir": money_fast(monto_a_recibir),
+        }),
+        unsafe_allow_html=True,
+    )
+
+    # ── 6. Cliente + CTA Registrar Venta ──────────────────────
+    problems: list[str] = []
+    can_save = True
+    if not cart:
+        can_save = False
+        problems.append("Carrito vacío.")
+    if total_cobrado <= 0:
+        can_save = False
+        problems.append("Total cobrado debe ser > 0.")
+    if not can_save:
+        st.caption(" • " + " ".join([f"❗{p}" for p in problems]))
+
+    # Cliente/Notas dentro de un form: escribir no dispara reruns, solo el submit.
+    # Método, envío y courier quedan fuera para que el Resumen se actualice en vivo.
+    with st.form("sale_form", clear_on_submit=False, border=False):
+        st.markdown('<span class="v-label">Nombre del cliente</span>', unsafe_allow_html=True)
+        cliente = st.text_input("Cliente", placeholder="Escribe el nombre completo...",
+                                key="cliente", label_visibility="collapsed")
+
+        st.markdown('<span class="v-label">Notas (opcional)</span>', unsafe_allow_html=True)
+        notas = st.text_area("Notas", placeholder="Información adicional sobre la venta...",
+                             key="notas", label_visibility="collapsed")
+
+        save_btn = st.form_submit_button("REGISTRAR VENTA", use_container_width=True,
+                                         disabled=not can_save, type="primary")
+
+    if save_btn and not str(cliente).strip():
+        st.error("❗Cliente vacío.")
+        save_btn = False
+
+    # Guard anti doble-click: el mismo carrito/cliente/total enviado de nuevo en pocos segundos
+    # (un segundo click interrumpe el rerun anterior) no vuelve a registrar la venta.
+    sale_key = hash((
+        tuple((it["SKU"], int(it["Cantidad"]), it["Bodega_Salida"]) for it in cart),
+        str(cliente).strip(), total_cobrado,
+    ))
+    last_key, last_ts = st.session_state["_last_sale"]
+    if save_btn and sale_key == last_key and time.monotonic() - last_ts < _SALE_DEBOUNCE_S:
+        st.info("Esa venta ya se está registrando.")
+        save_btn = False
+
+    if save_btn:
+        st.session_state["_last_sale"] = (sale_key, time.monotonic())
+        try:
+            # Cabecera cacheada (cada escritura invalida su hoja) + correlativo de la sesión,
+            # en vez de re-descargar la hoja completa en cada venta. Vacía en caché puede ser una
+            # lectura fallida (429 -> DataFrame vacío cacheado): se relee directo, que sí lanza error.
+            cab_df = load_cabecera(conn)
+            if cab_df.empty:
+                cab_df = load_cabecera(conn, ttl_s=0)
+            venta_seq = cast(dict[int, int], st.session_state["venta_seq"])
+            now_iso  = datetime.now(APP_TZ).isoformat(timespec="seconds")
+            fecha, hora = now_iso[:10], now_iso[11:19]
+            year     = int(fecha[:4])
+            venta_id = next_venta_id(cab_df, year, min_n=venta_seq.get(year, 0))
+
+            # Filas como listas en el orden de CAB_REQUIRED / DET_REQUIRED (van directo al append)
+            cab_row = [
+                venta_id, fecha, hora, str(cliente).strip(), metodo_pago,
+                float(envio_cliente), float(costo_courier), float(com_porc),
+                float(total_lineas), float(total_cobrado), float(com_monto), float(monto_a_recibir),
+                str(notas).strip(), "COMPLETADA",
+            ]
+
+            det_rows: list[list[Any]] = [
+                [
+                    venta_id, idx,
+                    str(item["SKU"]).strip(), str(item["Producto"]).strip(), str(item["Drop"]).strip(),
+                    str(item["Color"]).strip(), str(item["Talla"]).strip(),
+                    # FIX #1: guardar nombre visible en Detalle pero usando la clave interna del ítem
+                    fmt_bodega(item["Bodega_Salida"]),
+                    int(item["Cantidad"]), float(item["Precio_Unitario"]),
+                    float(item["Descuento_Unitario"]), float(item["Subtotal_Linea"]),
+                ]
+                for idx, item in enumerate(cart, start=1)
+            ]
+
+            # Descuento por (SKU, bodega interna de CADA ítem). El stock se valida contra el valor
+            # actual de esas celdas dentro del mismo commit (no se relee todo el Inventario).
+            stock_deltas: dict[tuple[str, str], int] = {}
+            for item in cart:
+                sku_i    = str(item["SKU"]).strip()
+                # FIX #2: descontar de la bodega correcta de CADA ítem, no de la bodega actual del selector
+                item_col = "Stock_Casa" if item["Bodega_Salida"] == "Casa" else "Stock_Bodega"
+                stock_deltas[(sku_i, item_col)] = stock_deltas.get((sku_i, item_col), 0) - int(item["Cantidad"])
+
+            # Un solo batchUpdate: append de cabecera + detalle y solo las celdas de stock tocadas.
+            try:
+                commit_sale(conn, cab_row, det_rows, stock_deltas)
+            except DuplicateKeyError:
+                # La cabecera cacheada iba atrasada (venta desde otro proceso o edición manual de la
+                # hoja): se relee directo, se recalcula el correlativo y se reintenta una vez
+                cab_df = load_cabecera(conn, ttl_s=0)
+                venta_id = next_venta_id(cab_df, year, min_n=venta_seq.get(year, 0))
+                cab_row[0] = venta_id
+                for r in det_rows:
+                    r[0] = venta_id
+                commit_sale(conn, cab_row, det_rows, stock_deltas)
+            venta_seq[year] = int(venta_id.rsplit("-", 1)[1])
+            st.success(f"✅ Venta registrada: {venta_id}")
+            st.session_state["_reset_sale_pending"] = True
+            st.rerun()
+        except ValueError as e:
+            # SKU inexistente o stock insuficiente: no se escribió nada
+            st.session_state["_last_sale"] = (None, 0.0)
+            st.error(f"❗ No se registró la venta. {e}")
+        except Exception as e:
+            st.session_state["_last_sale"] = (None, 0.0)
+            st.error("Error al registrar la venta.")
+            st.exception(e)
 
 
 def render_ventas_page(
@@ -326,10 +527,11 @@ def render_ventas_page(
         st.warning("No pude cargar el Inventario desde Google Sheets (si viste 429, esperá 60–90s).")
         st.stop()
 
-    inv_activo = inv_df[inv_df["Activo"] == True].copy()
+    # Solo se lee (índice cacheado): filtro sin copia
+    inv_activo = inv_df[inv_df["Activo"] == True]
     if inv_activo.empty and len(inv_df) > 0:
         st.warning("Tu inventario tiene filas, pero el filtro 'Activo' quedó en 0. Permito ventas usando TODOS los SKUs.")
-        inv_activo = inv_df.copy()
+        inv_activo = inv_df
 
     if inv_activo.empty:
         st.warning("Tu Inventario está vacío o todo está inactivo.")
@@ -401,34 +603,34 @@ def render_ventas_page(
         # ── 2. Agregar Producto ───────────────────────────────────
         st.markdown('<div class="v-section-title" style="margin-top:20px">Agregar Producto</div>', unsafe_allow_html=True)
 
+        # Opciones Producto -> Color -> Talla desde un índice cacheado (sin filtrar el DataFrame en cada rerun)
+        inv_idx  = inventory_index(inv_activo)
+        variants = inv_idx["variants"]
+
         st.markdown('<span class="v-label">Producto</span>', unsafe_allow_html=True)
-        productos = sorted([p for p in inv_activo["Producto"].dropna().unique().tolist() if str(p).strip()])
+        productos = inv_idx["productos"]
         producto_sel = st.selectbox("Producto", productos, index=0, label_visibility="collapsed")
 
-        df_p = inv_activo[inv_activo["Producto"] == producto_sel].copy()
+        by_color = variants.get(producto_sel, {})
         ccol, tcol = st.columns(2)
         with ccol:
             st.markdown('<span class="v-label">Color</span>', unsafe_allow_html=True)
-            colores = sorted([c for c in df_p["Color"].dropna().unique().tolist() if str(c).strip()])
+            colores = list(by_color)
             color_sel = st.selectbox("Color", colores, index=0, label_visibility="collapsed")
         with tcol:
             st.markdown('<span class="v-label">Talla</span>', unsafe_allow_html=True)
-            df_pc = df_p[df_p["Color"] == color_sel].copy()
-            tallas = sorted([t for t in df_pc["Talla"].dropna().unique().tolist() if str(t).strip()])
+            by_talla = by_color.get(color_sel, {})
+            tallas = list(by_talla)
             talla_sel = st.selectbox("Talla", tallas, index=0, label_visibility="collapsed")
 
-        df_pct = df_pc[df_pc["Talla"] == talla_sel].copy()
-        if df_pct.empty:
+        row_label = by_talla.get(talla_sel)
+        if row_label is None:
             st.error("No encontré esa variante en inventario.")
             st.stop()
 
-        row = df_pct.iloc[0]
-        sku        = str(row["SKU"]).strip()
-        drop       = str(row["Drop"]).strip()
-        precio_unit = float(_clean_number(row["Precio_Lista"]))
-        stock_casa   = int(_clean_number(row["Stock_Casa"]))
-        stock_bodega = int(_clean_number(row["Stock_Bodega"]))
-        stock_disp   = stock_casa if bodega_venta == "Casa" else stock_bodega
+        # Campos de la variante como tupla de escalares Python del índice (sin indexado de pandas)
+        sku, drop, precio_unit, stock_casa, stock_bodega = inv_idx["items"][row_label]
+        stock_disp = stock_casa if bodega_venta == "Casa" else stock_bodega
 
         # Warning banner
         if stock_disp <= 0:
@@ -482,6 +684,8 @@ def render_ventas_page(
                             type="secondary")
         if add_btn:
             cart_list = cast(list[dict[str, Any]], st.session_state["cart"])
+            # El nombre visible del ítem (con o sin color) se arma una vez al añadir, no en cada rerun
+            color_str = f" · {color_sel}" if str(color_sel).lower() not in ("", "standard", "nan") else ""
             cart_list.append({
                 "SKU": sku, "Drop": drop, "Producto": producto_sel,
                 "Color": color_sel, "Talla": talla_sel,
@@ -490,6 +694,7 @@ def render_ventas_page(
                 "Precio_Unitario": float(precio_unit),
                 "Descuento_Unitario": float(desc_u),
                 "Subtotal_Linea": float(subtotal_linea),
+                "Nombre": f"{producto_sel}{color_str} · {talla_sel}",
             })
             st.session_state["cart"] = cart_list
             st.toast("Agregado al carrito ✅")
@@ -510,196 +715,42 @@ def render_ventas_page(
         if not cart:
             st.caption("Aún no has agregado productos.")
         else:
-            for i, item in enumerate(cart, start=1):
-                c_left, c_right = st.columns([6, 2])
-                with c_left:
-                    color_str = f" · {item['Color']}" if str(item['Color']).lower() not in ("", "standard", "nan") else ""
-                    st.markdown(
-                        f'<div class="v-cart-item">'
-                        f'<div>'
-                        f'<div class="v-cart-item-name">{item["Producto"]}{color_str} · {item["Talla"]}</div>'
-                        f'<div class="v-cart-item-meta">Cant: {item["Cantidad"]} · {money(item["Subtotal_Linea"])} · {fmt_bodega(str(item["Bodega_Salida"]))}</div>'
-                        f'</div>'
-                        f'</div>',
-                        unsafe_allow_html=True,
-                    )
-                with c_right:
-                    if st.button("Quitar", key=f"rm_{i}_{item['SKU']}", use_container_width=True):
-                        cart.pop(i - 1)
-                        st.session_state["cart"] = cart
-                        st.rerun()
+            # Todas las líneas en UN st.markdown y un solo selector + botón para quitar:
+            # la cantidad de widgets no crece con el carrito
+            st.markdown(
+                "".join(
+                    f'<div class="v-cart-item">'
+                    f'<div>'
+                    f'<div class="v-cart-item-name">{i}. {item["Nombre"]}</div>'
+                    f'<div class="v-cart-item-meta">Cant: {item["Cantidad"]} · {money(item["Subtotal_Linea"])} · {fmt_bodega(str(item["Bodega_Salida"]))}</div>'
+                    f'</div>'
+                    f'</div>'
+                    for i, item in enumerate(cart, start=1)
+                ),
+                unsafe_allow_html=True,
+            )
+
+            c_left, c_right = st.columns([6, 2])
+            with c_left:
+                rm_ix = st.selectbox(
+                    "Línea a quitar",
+                    options=range(n_items),
+                    format_func=lambda ix: f'{ix + 1}. {cart[ix]["Nombre"]}',
+                    key="cart_rm_sel",
+                    label_visibility="collapsed",
+                )
+            with c_right:
+                if st.button("Quitar", key="cart_rm_btn", use_container_width=True) and rm_ix is not None:
+                    cart.pop(rm_ix)
+                    st.session_state["cart"] = cart
+                    st.rerun()
 
             if st.button("🧹 Vaciar carrito", use_container_width=True, key="vaciar_carrito_btn"):
                 st.session_state["cart"] = []
                 st.rerun()
 
-        # ── 4. Datos de venta ──────────────────────────────────────
-        st.markdown('<div class="v-section-title" style="margin-top:20px">Datos de venta</div>', unsafe_allow_html=True)
-
-        st.markdown('<span class="v-label">Nombre del cliente</span>', unsafe_allow_html=True)
-        cliente = st.text_input("Cliente", placeholder="Escribe el nombre completo...",
-                                key="cliente", label_visibility="collapsed")
-
-        st.markdown('<span class="v-label">Notas (opcional)</span>', unsafe_allow_html=True)
-        notas = st.text_area("Notas", placeholder="Información adicional sobre la venta...",
-                             key="notas", label_visibility="collapsed")
-
-        st.markdown('<span class="v-label">Método de pago</span>', unsafe_allow_html=True)
-        metodo_pago = st.selectbox(
-            "Método de pago",
-            options=["Transferencia", "Efectivo", "Tarjeta", "Contra Entrega"],
-            key="metodo_pago", label_visibility="collapsed",
-        )
-
-        cc1, cc2 = st.columns(2)
-        with cc1:
-            st.markdown('<span class="v-label">Envío cobrado ($)</span>', unsafe_allow_html=True)
-            envio_cliente = st.number_input("Envío", min_value=0.0, step=0.50, format="%.2f",
-                                            key="envio_cliente", label_visibility="collapsed")
-        with cc2:
-            st.markdown('<span class="v-label">Costo real courier ($)</span>', unsafe_allow_html=True)
-            costo_courier = st.number_input("Courier", min_value=0.0, step=0.50, format="%.2f",
-                                            key="costo_courier", label_visibility="collapsed")
-
-        override_pce: float | None = None
-        if metodo_pago == "Contra Entrega":
-            st.markdown("**Comisión PCE (Contra Entrega)**")
-            pce_mode = st.radio("Comisión", ["2.99%", "Otro"], horizontal=True, key="pce_mode")
-            if pce_mode == "Otro":
-                p_val = st.number_input("Porcentaje PCE (%)", min_value=0.0, step=0.10,
-                                        format="%.2f", key="pce_otro")
-                override_pce = float(p_val) / 100.0
-
-
-        # ── 5. Resumen ────────────────────────────────────────────
-        total_lineas    = round(sum(float(x["Subtotal_Linea"]) for x in cart), 2) if cart else 0.0
-        total_cobrado   = round(total_lineas + float(envio_cliente), 2)
-        com_porc        = comision_porcentaje(metodo_pago, cfg, override_pce)
-        com_monto       = round(total_cobrado * float(com_porc), 2)
-        monto_a_recibir = round(total_cobrado - float(costo_courier) - com_monto, 2)
-        monto_class     = "" if monto_a_recibir >= 0 else "red"
-
-        st.markdown(
-            f'<div class="v-resumen-card">'
-            f'<div class="v-resumen-title">Resumen Económico</div>'
-            f'<div class="v-resumen-row"><span class="v-resumen-label">Subtotal productos</span><span class="v-resumen-value">{money(total_lineas)}</span></div>'
-            f'<div class="v-resumen-row"><span class="v-resumen-label">Envío cobrado</span><span class="v-resumen-value">{money(envio_cliente)}</span></div>'
-            f'<div class="v-resumen-divider"></div>'
-            f'<div class="v-resumen-row"><span class="v-resumen-total-label">Total cobrado</span><span class="v-resumen-total-val">{money(total_cobrado)}</span></div>'
-            f'<div class="v-resumen-divider"></div>'
-            f'<div class="v-resumen-row"><span class="v-resumen-label">Costo courier</span><span class="v-resumen-value v-resumen-red">-{money(costo_courier)}</span></div>'
-            f'<div class="v-resumen-row"><span class="v-resumen-label">Comisión ({com_porc*100:.2f}%)</span><span class="v-resumen-value v-resumen-red">-{money(com_monto)}</span></div>'
-            f'<div class="v-monto-box">'
-            f'<span class="v-monto-label">Monto a recibir</span>'
-            f'<span class="v-monto-value {monto_class}">{money(monto_a_recibir)}</span>'
-            f'</div>'
-            f'</div>',
-            unsafe_allow_html=True,
-        )
-
-        # ── 6. CTA Registrar Venta ────────────────────────────────
-        problems: list[str] = []
-        can_save = True
-        if not cart:
-            can_save = False
-            problems.append("Carrito vacío.")
-        if not str(cliente).strip():
-            can_save = False
-            problems.append("Cliente vacío.")
-        if total_cobrado <= 0:
-            can_save = False
-            problems.append("Total cobrado debe ser > 0.")
-        if not can_save:
-            st.caption(" • " + " ".join([f"❗{p}" for p in problems]))
-
-        save_btn = st.button("REGISTRAR VENTA", use_container_width=True,
-                             disabled=not can_save, key="registrar_venta", type="primary")
-        if save_btn:
-            try:
-                latest_inv = load_inventario(conn, ttl_s=0)
-
-                # FIX #2: validar stock usando la bodega interna de CADA ítem del carrito
-                for item in cart:
-                    sku_i      = str(item["SKU"]).strip()
-                    qty_i      = int(item["Cantidad"])
-                    # Bodega_Salida se guardó como clave interna ("Casa" / "Bodega") al añadir al carrito
-                    item_col   = "Stock_Casa" if item["Bodega_Salida"] == "Casa" else "Stock_Bodega"
-                    match      = latest_inv[latest_inv["SKU"].astype(str).str.strip() == sku_i]
-                    if match.empty:
-                        raise ValueError(f"SKU no encontrado: {sku_i}")
-                    available = int(_clean_number(match.iloc[0].get(item_col, 0)))
-                    if available < qty_i:
-                        raise ValueError(
-                            f"Stock insuficiente para {sku_i} en {fmt_bodega(item['Bodega_Salida'])}. "
-                            f"Disponible={available}, Pedido={qty_i}"
-                        )
-
-                cab_df   = load_cabecera(conn, ttl_s=0)
-                det_df   = load_detalle(conn, ttl_s=0)
-                now      = datetime.now(APP_TZ)
-                year     = int(now.strftime("%Y"))
-                venta_id = next_venta_id(cab_df, year)
-                fecha    = now.strftime("%Y-%m-%d")
-                hora     = now.strftime("%H:%M:%S")
-
-                cab_row = {
-                    "Venta_ID": venta_id, "Fecha": fecha, "Hora": hora,
-                    "Cliente": str(cliente).strip(), "Metodo_Pago": metodo_pago,
-                    "Envio_Cobrado_Total": float(envio_cliente),
-                    "Costo_Logistica_Total": float(costo_courier),
-                    "Comision_Porc": float(com_porc),
-                    "Total_Lineas": float(total_lineas),
-                    "Total_Cobrado": float(total_cobrado),
-                    "Comision_Monto": float(com_monto),
-                    "Monto_A_Recibir": float(monto_a_recibir),
-                    "Notas": str(notas).strip(), "Estado": "COMPLETADA",
-                }
-
-                det_rows: list[dict[str, Any]] = []
-                for idx, item in enumerate(cart, start=1):
-                    det_rows.append({
-                        "Venta_ID": venta_id, "Linea": idx,
-                        "SKU": str(item["SKU"]).strip(),
-                        "Producto": str(item["Producto"]).strip(),
-                        "Drop": str(item["Drop"]).strip(),
-                        "Color": str(item["Color"]).strip(),
-                        "Talla": str(item["Talla"]).strip(),
-                        # FIX #1: guardar nombre visible en Detalle pero usando la clave interna del ítem
-                        "Bodega_Salida": fmt_bodega(item["Bodega_Salida"]),
-                        "Cantidad": int(item["Cantidad"]),
-                        "Precio_Unitario": float(item["Precio_Unitario"]),
-                        "Descuento_Unitario": float(item["Descuento_Unitario"]),
-                        "Subtotal_Linea": float(item["Subtotal_Linea"]),
-                    })
-
-                cab_df  = _align_required_columns(cab_df, CAB_REQUIRED)
-                cab_out = pd.concat([cab_df, pd.DataFrame([cab_row])], ignore_index=True)
-                cab_out = _align_required_columns(cab_out, CAB_REQUIRED)
-                save_sheet(conn, SHEET_VENTAS_CAB, cab_out)
-
-                det_df  = _align_required_columns(det_df, DET_REQUIRED)
-                det_out = pd.concat([det_df, pd.DataFrame(det_rows)], ignore_index=True)
-                det_out = _align_required_columns(det_out, DET_REQUIRED)
-                save_sheet(conn, SHEET_VENTAS_DET, det_out)
-
-                inv_updated = latest_inv.copy()
-                for item in cart:
-                    sku_i    = str(item["SKU"]).strip()
-                    qty_i    = int(item["Cantidad"])
-                    # FIX #2: descontar de la bodega correcta de CADA ítem, no de la bodega actual del selector
-                    item_col = "Stock_Casa" if item["Bodega_Salida"] == "Casa" else "Stock_Bodega"
-                    mask     = inv_updated["SKU"].astype(str).str.strip() == sku_i
-                    ix       = inv_updated.index[mask].tolist()[0]
-                    inv_updated.loc[ix, item_col] = int(_clean_number(inv_updated.loc[ix, item_col])) - qty_i
-
-                save_sheet(conn, SHEET_INVENTARIO, inv_updated)
-                st.success(f"✅ Venta registrada: {venta_id}")
-                st.cache_data.clear()
-                st.session_state["_reset_sale_pending"] = True
-                st.rerun()
-            except Exception as e:
-                st.error("Error al registrar la venta.")
-                st.exception(e)
+        # ── 4-6. Datos de venta + Resumen + Registrar (fragmento) ─────
+        _render_checkout(conn, cfg, APP_TZ, fmt_bodega)
 
     # ══════════════════════════════════════════════════════════════
     # MODO: EGRESOS
@@ -723,15 +774,14 @@ def render_ventas_page(
 
         # Catálogos (drops)
         try:
-            cat_df    = load_catalogos(conn, ttl_s=600)
-            cat       = parse_catalogos(cat_df)
+            cat       = load_catalogos_parsed(conn, ttl_s=600)
             drops_cat = cat.get("drops", []) or []
         except Exception:
             drops_cat = []
 
         def _pretty_drop_label(v: str) -> str:
             v = str(v or "").strip()
-            m = re.match(r"^D(\d{3})$", v.upper())
+            m = _DROP_CODE_RE.match(v.upper())
             if m:
                 return f"DROP {int(m.group(1)):02d}"
             if v.upper().startswith("DROP"):
@@ -754,9 +804,8 @@ def render_ventas_page(
         if not egresos_df_full.empty:
             now_tz = datetime.now(APP_TZ)
             mes_str = now_tz.strftime("%Y-%m")
-            eg_tmp = egresos_df_full.copy()
-            eg_tmp["_dt"] = pd.to_datetime(eg_tmp["Fecha"], errors="coerce", dayfirst=True)
-            eg_mes = eg_tmp[eg_tmp["_dt"].dt.strftime("%Y-%m") == mes_str]
+            # _Fecha_dt viene parseada desde load_egresos
+            eg_mes = egresos_df_full[egresos_df_full["_Fecha_dt"].dt.strftime("%Y-%m") == mes_str]
             total_mes = float(pd.to_numeric(eg_mes["Monto"], errors="coerce").fillna(0).sum())
 
         st.markdown(
@@ -810,11 +859,7 @@ def render_ventas_page(
             if st.button("➕", key="eg_cat_add_btn", use_container_width=True, help="Agregar categoría"):
                 nueva = (ss["eg_categoria_new"] or "").strip()
                 if nueva and nueva not in categorias_list:
-                    cat_df_fresh = load_categorias(conn, ttl_s=0)
-                    nueva_fila   = pd.DataFrame([{"Categoria": nueva}])
-                    cat_out      = pd.concat([cat_df_fresh, nueva_fila], ignore_index=True)
-                    save_sheet(conn, SHEET_CATEGORIAS, cat_out)
-                    st.cache_data.clear()
+                    append_rows_sheet(conn, SHEET_CATEGORIAS, [{"Categoria": nueva}], CAT_REQUIRED)
                     ss["eg_categoria_sel"] = nueva
                     ss["eg_categoria_new"] = ""
                     st.rerun()
@@ -822,7 +867,6 @@ def render_ventas_page(
         can_save_eg = (float(ss["eg_monto"] or 0.0) > 0) and bool((ss["eg_concepto"] or "").strip())
         if st.button("Registrar Gasto", use_container_width=True,
                      disabled=not can_save_eg, key="eg_guardar_btn", type="primary"):
-            st.cache_data.clear()
             eg_fresh = load_egresos(conn, ttl_s=0)
             new_id   = _next_egreso_id(eg_fresh)
             row = {
@@ -834,8 +878,7 @@ def render_ventas_page(
                 "Notas": (ss["eg_notas"] or "").strip(),
                 "Drop": (ss["eg_drop_sel"] or "").strip(),
             }
-            eg_out = pd.concat([eg_fresh, pd.DataFrame([row])], ignore_index=True)
-            save_sheet(conn, SHEET_EGRESOS, eg_out)
+            append_rows_sheet(conn, SHEET_EGRESOS, [row], EG_REQUIRED)
 
             for k in ["eg_monto_input", "eg_concepto_input", "eg_notas_input",
                       "eg_drop_select", "eg_categoria_sel_input", "eg_fecha_input"]:
@@ -897,20 +940,20 @@ def render_ventas_page(
         if egresos_df_full.empty:
             st.caption("Aún no hay movimientos registrados.")
         else:
-            eg_show = egresos_df_full.copy()
-            eg_show["_fecha_dt"] = pd.to_datetime(eg_show["Fecha"], errors="coerce", dayfirst=True)
-            eg_show = eg_show.sort_values("_fecha_dt", ascending=False).head(10)
+            eg_show = egresos_df_full.nlargest(10, "_Fecha_dt")
 
             cat_icons_map = {"materiales": "⚙️", "samples": "👕", "suscripciones": "🧾"}
-            for _, r in eg_show.iterrows():
-                cat_raw  = str(r.get("Categoria", "")).strip().lower()
+            # Todos los movimientos en un solo bloque HTML -> un único st.markdown
+            tx_items: list[str] = []
+            for r in eg_show[["Categoria", "Concepto", "Fecha", "Monto"]].to_dict("records"):
+                cat_raw  = str(r["Categoria"]).strip().lower()
                 icon     = cat_icons_map.get(cat_raw, "💸")
-                concepto = str(r.get("Concepto", ""))
-                cat_str  = str(r.get("Categoria", "")).strip() or "Sin categoría"
-                fecha    = str(r.get("Fecha", ""))
-                monto    = float(pd.to_numeric(r.get("Monto", 0), errors="coerce") or 0)
+                concepto = str(r["Concepto"])
+                cat_str  = str(r["Categoria"]).strip() or "Sin categoría"
+                fecha    = str(r["Fecha"])
+                monto    = float(pd.to_numeric(r["Monto"], errors="coerce") or 0)
 
-                st.markdown(
+                tx_items.append(
                     f'<div class="eg-tx-item">'
                     f'<div style="display:flex;align-items:center;flex:1;min-width:0">'
                     f'<div class="eg-tx-icon-wrap">{icon}</div>'
@@ -920,6 +963,6 @@ def render_ventas_page(
                     f'</div>'
                     f'</div>'
                     f'<span class="eg-tx-amount">-{money(monto)}</span>'
-                    f'</div>',
-                    unsafe_allow_html=True,
-                )
\ No newline at end of file
+                    f'</div>'
+                )
+            st.markdown("".join(tx_items), unsafe_allow_html=True)
\ No newline at end of file